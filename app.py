@@ -1,45 +1,42 @@
 # Import error logging packages
 import logging
+import os
 import traceback
 import sys
 
-# Set up logging to stderr
+# Set up logging to stderr (LOG_LEVEL=DEBUG for verbose output)
 logging.basicConfig(
-    level=logging.DEBUG, 
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[logging.StreamHandler(sys.stderr)]
 )
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
 
 # Log startup info
 logger.info("Starting application...")
 
 # Basic imports
 import base64
-import os
 import mimetypes
 import uuid
 import requests
 import json
-import io
+import hashlib
 import tempfile
-import subprocess
-import time
-import random
-import re
+import shutil
+import threading
+from concurrent.futures import wait as futures_wait, FIRST_COMPLETED
 from pathlib import Path
+from types import SimpleNamespace
 
-# Import Flask and extensions - do this early
-from flask import Flask, request, jsonify, send_from_directory, send_file, current_app, g
+# Import Flask and extensions
+from flask import (Blueprint, Flask, Response, stream_with_context, request, jsonify, send_from_directory,
+                   send_file, redirect, current_app, g)
+from werkzeug.local import LocalProxy
 from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.exceptions import Unauthorized
 
-# Create Flask app early to avoid circular imports
-app = Flask(__name__, static_folder='public', static_url_path='')
-logger.info("Flask app created")
-
 # Load environment variables
 from dotenv import load_dotenv
 load_dotenv()
@@ -48,58 +45,11 @@ logger.info("Environment variables loaded")
 # Import config after env vars are loaded
 from config import config
 
-# Get configuration mode
-config_name = os.environ.get('FLASK_CONFIG', 'default')
-# Clean up config_name if it's corrupted with other env vars
-if ' ' in config_name:
-    logger.warning(f"FLASK_CONFIG appears to be corrupted: {config_name}")
-    # Extract the actual config name (first word)
-    config_name = config_name.split(' ')[0]
-    logger.info(f"Using extracted config name: {config_name}")
-
-logger.info(f"Using configuration: {config_name}")
-
-# Apply configuration with error handling
-try:
-    app.config.from_object(config[config_name])
-    config[config_name].init_app(app)
-    logger.info("Configuration applied")
-except KeyError:
-    logger.error(f"Invalid config name: {config_name}, using default instead")
-    app.config.from_object(config['default'])
-    config['default'].init_app(app)
-except Exception as e:
-    logger.error(f"Error applying configuration: {str(e)}")
-    logger.error(traceback.format_exc())
-    # Use default configuration as fallback
-    app.config.from_object(config['default'])
-    config['default'].init_app(app)
-
 # Import db and models
 from models import db, User, Redesign
-logger.info("Models imported")
-
-# Initialize database with app
-db.init_app(app)
-logger.info("SQLAlchemy initialized")
-
-# Create database tables within app context if needed
-with app.app_context():
-    try:
-        db.create_all()
-        logger.info("Database tables created successfully")
-    except Exception as e:
-        logger.error(f"Error creating database tables: {str(e)}")
-        logger.error(traceback.format_exc())
 
-# Initialize other extensions
 from flask_migrate import Migrate
-migrate = Migrate(app, db)
-logger.info("Flask-Migrate initialized")
-
 from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity
-jwt = JWTManager(app)
-logger.info("JWTManager initialized")
 
 # Set constants for anonymous usage
 MAX_ANONYMOUS_USAGE = 3
@@ -107,74 +57,272 @@ ANONYMOUS_COOKIE_NAME = 'redesign_anonymous_id'
 
 # Import auth after extensions and models
 from auth import auth_bp, auth_required, track_redesign
-app.register_blueprint(auth_bp, url_prefix='/auth')
-logger.info("Auth blueprint registered")
-
-# Configure proxy headers for cloud run
-app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
-logger.info("ProxyFix applied")
-
-# Ensure required directories exist
-try:
-    os.makedirs('uploads', exist_ok=True)
-    os.makedirs('generated', exist_ok=True)
-    os.makedirs('logs', exist_ok=True)
-    logger.info("Created required directories")
-except Exception as e:
-    logger.error(f"Error creating directories: {str(e)}")
-    logger.error(traceback.format_exc())
-
-# Make generated directory accessible to static file server
-app.config['GENERATED_FOLDER'] = os.path.abspath('generated')
-logger.info(f"GENERATED_FOLDER set to: {app.config['GENERATED_FOLDER']}")
-
-# Initialize AI clients
+
+# Buffer uploads in memory rather than spilling them to temporary files
+from ingest import SpooledUploadRequest, upload_stream
+
 # Load API keys from environment
 API_KEY = os.environ.get("GEMINI_API_KEY")
 CLAUDE_API_KEY = os.environ.get("CLAUDE_API_KEY")
 CLAUDE_MODEL = os.environ.get("CLAUDE_MODEL", "claude-3-sonnet-20240229")
 logger.info(f"Using CLAUDE_MODEL: {CLAUDE_MODEL}")
 
-# Initialize the Gemini client
-try:
-    from google import genai
-    from google.genai import types
-client = genai.Client(api_key=API_KEY)
-    logger.info("Gemini client initialized")
-except Exception as e:
-    logger.error(f"Error initializing Gemini client: {str(e)}")
-    logger.error(traceback.format_exc())
-    client = None
-
-# Import PIL last to avoid potential conflicts
-try:
-    from PIL import Image
-    logger.info("PIL imported successfully")
-except Exception as e:
-    logger.error(f"Error importing PIL: {str(e)}")
-    logger.error(traceback.format_exc())
+from jobs import JobManager, JobQueueFull, JOB_FAILED
+from claude_client import ClaudeClient, iter_stream_events
+from suggestions import (SUGGESTIONS_PROMPT, PROMPT_VERSION, SuggestionStreamParser,
+                         has_fallbacks, parse_suggestions)
+from suggestion_cache import SuggestionCache
+from assets import InvalidImageHandle, make_handle, resolve_handle
+from gemini_files import GeminiFileCache, file_sha256
+from downloads import create_download_store
+from storage import create_storage
+from janitor import create_janitor
+from usage import usage_counters
+from db_pool import pool_stats, release_connection, watch_engine
+from image_workers import ImageWorkersBusy, image_workers
+from metrics import metrics
+from image_pipeline import (DECODE_ERRORS, ModelImageLimits, prepare_for_model, available_heic_converters,
+                            convert_heic, store_upload, write_preview, write_download)
+
+PREVIEW_FOLDER = os.path.join('generated', 'previews')
+DOWNLOAD_FOLDER = os.path.join('generated', 'downloads')
+# Top-level folders whose files are copied to storage
+STORED_FOLDERS = ('generated', 'uploads')
+
+# Routes live on a blueprint so create_app() can build the app
+main = Blueprint('main', __name__)
+
+# Services the routes use. create_app() builds a set per app in app.extensions['redesign'],
+# and these names resolve to the current app's, in requests and in jobs alike.
+def _service(name):
+    return LocalProxy(lambda: getattr(current_app.extensions['redesign'], name))
+
+job_manager = _service('job_manager')
+claude_client = _service('claude_client')
+suggestion_cache = _service('suggestion_cache')
+gemini_file_cache = _service('gemini_file_cache')
+download_store = _service('download_store')
+storage = _service('storage')
+janitor = _service('janitor')
+
+def image_limits(provider):
+    """The current app's ModelImageLimits for 'claude' or 'gemini'"""
+    return current_app.extensions['redesign'].image_limits[provider]
+
+# The Gemini SDK is slow to import, so it's only loaded on first use
+_gemini_client = None
+_gemini_lock = threading.Lock()
+
+def get_gemini_client():
+    """The shared Gemini client, created on first use"""
+    global _gemini_client
+    if _gemini_client is None:
+        with _gemini_lock:
+            if _gemini_client is None:
+                from google import genai
+                _gemini_client = genai.Client(api_key=API_KEY)
+                logger.info("Gemini client initialized")
+    return _gemini_client
+
+def get_config_name():
+    # Get configuration mode
+    config_name = os.environ.get('FLASK_CONFIG', 'default')
+    # Clean up config_name if it's corrupted with other env vars
+    if ' ' in config_name:
+        logger.warning(f"FLASK_CONFIG appears to be corrupted: {config_name}")
+        # Extract the actual config name (first word)
+        config_name = config_name.split(' ')[0]
+        logger.info(f"Using extracted config name: {config_name}")
+    return config_name
+
+def create_app(config_name=None):
+    """Build the Flask app and configure the services its routes use.
+
+    Nothing here talks to the database or the AI APIs, so cold starts only pay
+    for imports. Schema changes are applied separately with `flask db upgrade`.
+    """
+    app = Flask(__name__, static_folder='public', static_url_path='')
+    app.request_class = SpooledUploadRequest
+    
+    config_name = config_name or get_config_name()
+    logger.info(f"Using configuration: {config_name}")
+    
+    # Apply configuration with error handling
+    try:
+        app.config.from_object(config[config_name])
+        config[config_name].init_app(app)
+        logger.info("Configuration applied")
+    except KeyError:
+        logger.error(f"Invalid config name: {config_name}, using default instead")
+        app.config.from_object(config['default'])
+        config['default'].init_app(app)
+    except Exception as e:
+        logger.error(f"Error applying configuration: {str(e)}")
+        logger.error(traceback.format_exc())
+        # Use default configuration as fallback
+        app.config.from_object(config['default'])
+        config['default'].init_app(app)
+    
+    # Initialize database with app
+    db.init_app(app)
+    with app.app_context():
+        watch_engine(db.engine)
+        db_engine = db.engine
+    
+    # Local and test databases are created on the fly; deployed ones use migrations
+    if app.config['AUTO_CREATE_TABLES']:
+        with app.app_context():
+            try:
+                db.create_all()
+                logger.info("Database tables created successfully")
+            except Exception as e:
+                logger.error(f"Error creating database tables: {str(e)}")
+                logger.error(traceback.format_exc())
+    
+    # Initialize other extensions
+    Migrate(app, db)
+    JWTManager(app)
+    
+    app.register_blueprint(auth_bp, url_prefix='/auth')
+    app.register_blueprint(main)
+    
+    # Configure proxy headers for cloud run
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
+    
+    # Ensure required directories exist
+    try:
+        os.makedirs('uploads', exist_ok=True)
+        os.makedirs('generated', exist_ok=True)
+        os.makedirs(PREVIEW_FOLDER, exist_ok=True)
+        os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
+        os.makedirs('logs', exist_ok=True)
+    except Exception as e:
+        logger.error(f"Error creating directories: {str(e)}")
+        logger.error(traceback.format_exc())
+    
+    # Make generated directory accessible to static file server
+    app.config['GENERATED_FOLDER'] = os.path.abspath('generated')
+    
+    # This app's services, independent of any other app built in the same process
+    services = SimpleNamespace()
+    app.extensions['redesign'] = services
+    
+    # Background job queue for Gemini generations; jobs run in this app's context
+    services.job_manager = JobManager(
+        app=app,
+        max_workers=app.config['JOB_WORKERS'],
+        max_pending=app.config['JOB_MAX_PENDING'],
+        job_ttl=app.config['JOB_TTL_SECONDS']
+    )
+    
+    # One pooled client for every Claude API call
+    services.claude_client = ClaudeClient(
+        api_key=CLAUDE_API_KEY,
+        model=CLAUDE_MODEL,
+        pool_size=app.config['CLAUDE_POOL_SIZE'],
+        connect_timeout=app.config['CLAUDE_CONNECT_TIMEOUT'],
+        read_timeout=app.config['CLAUDE_READ_TIMEOUT'],
+        max_retries=app.config['CLAUDE_MAX_RETRIES']
+    )
+    
+    # Repeat submissions of the same image pair skip the Claude call
+    services.suggestion_cache = SuggestionCache(
+        max_entries=app.config['SUGGESTION_CACHE_SIZE'],
+        ttl=app.config['SUGGESTION_CACHE_TTL_SECONDS'],
+        use_database=app.config['SUGGESTION_CACHE_DATABASE']
+    )
+    
+    # Cache Gemini file uploads by content so repeat images aren't re-sent
+    services.gemini_file_cache = GeminiFileCache(
+        max_entries=app.config['GEMINI_FILE_CACHE_SIZE'],
+        ttl=app.config['GEMINI_FILE_TTL_SECONDS']
+    )
+    
+    # Download links that expire on their own and resolve on any worker
+    services.download_store = create_download_store(app)
+    
+    # Uploads and generated images are copied to shared storage so any instance can serve them
+    services.storage = create_storage(app)
+    
+    # Quota checks read cached per-identity counters instead of counting redesigns
+    usage_counters.configure(
+        ttl=app.config['USAGE_CACHE_TTL_SECONDS'],
+        max_entries=app.config['USAGE_CACHE_SIZE']
+    )
+    
+    # Old uploads and generated files are cleaned up in the background
+    services.janitor = create_janitor(app, 'uploads', 'generated', PREVIEW_FOLDER, DOWNLOAD_FOLDER)
+    app.before_request(services.janitor.start)
+    
+    # CPU-bound image work runs in its own processes, off the request threads
+    image_workers.configure(
+        max_workers=app.config['IMAGE_WORKERS'],
+        max_pending=app.config['IMAGE_MAX_PENDING']
+    )
+    
+    # Each model downsamples past its own resolution, so never send more than it will use
+    services.image_limits = {
+        'claude': ModelImageLimits('claude', app.config['CLAUDE_MAX_IMAGE_EDGE'], app.config['CLAUDE_MAX_IMAGE_BYTES']),
+        'gemini': ModelImageLimits('gemini', app.config['GEMINI_MAX_IMAGE_EDGE'], app.config['GEMINI_MAX_IMAGE_BYTES'])
+    }
+    
+    # Metrics exposed at /api/metrics: process-wide pools here, this app's services with each snapshot
+    metrics.register_collector('image_workers', image_workers.stats)
+    metrics.register_collector('usage', usage_counters.stats)
+    services.collectors = {
+        'jobs': services.job_manager.stats,
+        'gemini_files': services.gemini_file_cache.stats,
+        'suggestion_cache': services.suggestion_cache.stats,
+        'downloads': services.download_store.stats,
+        'storage': services.storage.stats,
+        'janitor': services.janitor.stats,
+        'db_pool': lambda: pool_stats(db_engine)
+    }
+    
+    # Probe HEIC support once at startup so uploads never try a missing converter
+    available_heic_converters()
+    
+    logger.info("App created")
+    return app
+
+def reset_after_fork():
+    """Drop connections and pools a preloading server's master handed to this worker"""
+    global _gemini_client
+    # Sockets opened in the master must not be shared between workers
+    with app.app_context():
+        db.engine.dispose()
+    app.extensions['redesign'].claude_client.reset()
+    image_workers.shutdown()
+    _gemini_client = None
+    logger.info(f"Worker {os.getpid()} reset after fork")
 
 # Define routes and other functions below this line
 # ===================================================
 
 # Minimal route for health check
-@app.route('/healthz')
+@main.route('/healthz')
 def healthz():
     return jsonify({"status": "ok"})
 
+# In-process metrics for this instance
+@main.route('/api/metrics')
+def get_metrics():
+    return jsonify(metrics.snapshot(current_app.extensions['redesign'].collectors))
+
 # Root route
-@app.route('/')
+@main.route('/')
 def index():
     try:
-    return send_from_directory('public', 'index.html')
+        return send_from_directory('public', 'index.html')
     except Exception as e:
         logger.error(f"Error serving index.html: {str(e)}")
         logger.error(traceback.format_exc())
         return jsonify({"error": "Error serving index page", "details": str(e)}), 500
 
-@app.route('/api/chat', methods=['POST'])
+@main.route('/api/chat', methods=['POST'])
 def chat():
     try:
+        from google.genai import types
         data = request.json
         message = data.get('message', '')
         
@@ -197,7 +345,7 @@ def chat():
             response_mime_type="text/plain",
         )
         
-        response = client.models.generate_content(
+        response = get_gemini_client().models.generate_content(
             model=model,
             contents=contents,
             config=generate_content_config,
@@ -209,139 +357,465 @@ def chat():
         print(f"Error in text chat: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/chat-with-image', methods=['POST'])
+def image_workers_busy():
+    """503 for when the image worker queue is full or the pool failed a task"""
+    response = jsonify({"error": "Server is busy, please try again shortly"})
+    response.headers["Retry-After"] = "5"
+    return response, 503
+
+def request_value(name):
+    """Read a field from either a form or a JSON request body"""
+    value = request.form.get(name)
+    if value is None and request.is_json:
+        value = (request.get_json(silent=True) or {}).get(name)
+    return value
+
+def get_request_image(field='image', prefix="", limits=None, preview_path=None):
+    """Resolve an uploaded file or a '<field>_handle' reference to (path, owned).
+
+    owned is True when the path is a fresh copy this request must clean up,
+    and False when it is a handle-backed file that outlives the request.
+    limits and preview_path are passed on to process_uploaded_image for uploads.
+    """
+    handle = request_value(f'{field}_handle')
+    if handle:
+        return resolve_handle(handle, fetch=ensure_local), False
+    
+    image_file = request.files.get(field)
+    if not image_file or image_file.filename == '':
+        return None, False
+    
+    # Process the uploaded image (handles HEIC conversion)
+    return process_uploaded_image(image_file, prefix=prefix, limits=limits, preview_path=preview_path), True
+
+@main.route('/api/chat-with-image', methods=['POST'])
 def chat_with_image():
     try:
-        message = request.form.get('message', '')
+        message = request_value('message') or ''
         is_preview_processing = message == 'Processing HEIC preview'
         
-        # Check for uploaded image
-        image_file = request.files.get('image')
-        if not image_file:
-            return jsonify({"error": "No image provided"}), 400
-        
-        # Process the uploaded image (handles HEIC conversion)
+        # Accept either an uploaded image or a handle to one we already have; uploads
+        # get their preview or Gemini rendition while they are decoded
+        preview_path = os.path.join(PREVIEW_FOLDER, f"{uuid.uuid4()}.jpg") if is_preview_processing else None
         try:
-            image_path = process_uploaded_image(image_file)
-            print(f"Processed image saved to {image_path}")
+            image_path, owned = get_request_image('image', limits=None if is_preview_processing else image_limits('gemini'),
+                                                  preview_path=preview_path)
+        except InvalidImageHandle as e:
+            return jsonify({"error": str(e)}), 404
+        except ImageWorkersBusy:
+            return image_workers_busy()
         except Exception as e:
             return jsonify({"error": f"Error processing image: {str(e)}"}), 400
+        if not image_path:
+            return jsonify({"error": "No image provided"}), 400
+        print(f"Using image at {image_path}")
         
-        # For preview processing, just return the processed image path
+        # Older clients ask for a preview through this endpoint
         if is_preview_processing:
-            # Generate a unique filename for the preview image
-            preview_name = f"image_preview_{uuid.uuid4()}.jpg"
-            preview_path = f"generated/{preview_name}"
-            
-            # Copy the processed image to a preview location
-            import shutil
-            shutil.copy(image_path, preview_path)
-            
-            # Clean up the uploaded file
-            os.remove(image_path)
+            try:
+                if not os.path.exists(preview_path):
+                    render_preview(image_path, preview_path)
+            except ImageWorkersBusy:
+                return image_workers_busy()
             
-            # Return the preview image URL
-            preview_url = f"/generated/{preview_name}"
+            # Keep the processed image so later steps can use its handle
+            publish(image_path)
+            publish(preview_path)
+            preview_url = f"/generated/previews/{os.path.basename(preview_path)}"
             return jsonify({
                 "text": "Preview processed",
-                "images": [preview_url]
+                "images": [preview_url],
+                "handle": make_handle(image_path)
             })
         
         # Regular image generation flow continues below
-        # Get mime type
-        mime_type = mimetypes.guess_type(image_path)[0] or "image/jpeg"
+        try:
+            return jsonify(generate_redesign_image(image_path, message))
+        finally:
+            # Clean up the uploaded file
+            if owned and os.path.exists(image_path):
+                os.remove(image_path)
+    
+    except Exception as e:
+        print(f"Error in image generation: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def generate_redesign_image(image_path, message, job=None):
+    """Run a Gemini image generation for one image and prompt"""
+    from google.genai import types
+    # Upload file to Gemini, reusing an earlier upload of the same bytes
+    if job:
+        job.update(progress=10, message="Uploading image")
+    uploaded_file = gemini_file_cache.get_or_upload(get_gemini_client(), image_path, limits=image_limits('gemini'))
+    
+    # Initialize the model
+    model = "gemini-2.0-flash-exp-image-generation"
+    
+    # Create content with image and text
+    contents = [
+        types.Content(
+            role="user",
+            parts=[
+                types.Part.from_uri(
+                    file_uri=uploaded_file.uri,
+                    mime_type=uploaded_file.mime_type,
+                ),
+                types.Part.from_text(text=message),
+            ],
+        ),
+    ]
+    
+    # Configure generation
+    generate_content_config = types.GenerateContentConfig(
+        temperature=1,
+        top_p=0.95,
+        top_k=40,
+        max_output_tokens=8192,
+        response_modalities=["image", "text"],
+        response_mime_type="text/plain",
+    )
+    
+    # List to store generated image names and their handles
+    generated_images = []
+    generated_handles = []
+    response_text = ""
+    
+    if job:
+        job.update(progress=30, message="Generating design")
+    
+    # Stream response to capture both text and images
+    for chunk in get_gemini_client().models.generate_content_stream(
+        model=model,
+        contents=contents,
+        config=generate_content_config,
+    ):
+        if not chunk.candidates or not chunk.candidates[0].content or not chunk.candidates[0].content.parts:
+            continue
+            
+        part = chunk.candidates[0].content.parts[0]
+        
+        # If chunk contains image data
+        if hasattr(part, 'inline_data') and part.inline_data:
+            file_name = f"generated/image_{uuid.uuid4()}"
+            inline_data = part.inline_data
+            file_extension = mimetypes.guess_extension(inline_data.mime_type) or ".png"
+            full_path = f"{file_name}{file_extension}"
+            
+            # Save the image, then copy it to storage in the background
+            with open(full_path, "wb") as f:
+                f.write(inline_data.data)
+            publish(full_path, inline_data.mime_type)
+            
+            # Get the filename without the full path
+            filename = os.path.basename(full_path)
+            
+            # Add to list of generated images (web path)
+            # Use a relative URL that can be served by Flask
+            image_web_path = f"/generated/{filename}"
+            generated_images.append(image_web_path)
+            generated_handles.append(make_handle(full_path))
+            
+            print(f"Generated image saved to: {full_path}")
+            print(f"Image will be served at: {image_web_path}")
+            
+            if job:
+                job.update(progress=90, message="Image generated")
+        else:
+            # Accumulate text response
+            if hasattr(chunk, 'text') and chunk.text:
+                response_text += chunk.text
+    
+    return {
+        "text": response_text,
+        "images": generated_images,
+        "image_handles": generated_handles
+    }
+
+def run_generation_job(job, image_path, message, cleanup=True):
+    """Job body for a queued redesign generation"""
+    try:
+        return generate_redesign_image(image_path, message, job=job)
+    finally:
+        # The processed upload belongs to the job once it is queued
+        if cleanup and os.path.exists(image_path):
+            os.remove(image_path)
+
+def remove_when_finished(futures, path):
+    """Delete a file shared by several jobs once the last of them is done"""
+    remaining = [len(futures)]
+    lock = threading.Lock()
+    
+    def on_done(_future):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] > 0:
+                return
+        if os.path.exists(path):
+            os.remove(path)
+            logger.info(f"Removed shared batch image: {path}")
+    
+    for future in futures:
+        future.add_done_callback(on_done)
+
+@main.route('/api/image-preview', methods=['POST'])
+def image_preview():
+    """Small preview of an upload the browser can't display (e.g. HEIC), plus a handle to the full image"""
+    image_file = request.files.get('image')
+    if not image_file or image_file.filename == '':
+        return jsonify({"error": "No image provided"}), 400
+    
+    # Name both the preview and the processed upload after the content, so repeats are free
+    digest = hashlib.sha256()
+    stream = upload_stream(image_file)
+    for block in iter(lambda: stream.read(1024 * 1024), b''):
+        digest.update(block)
+    digest = digest.hexdigest()
+    
+    upload_path = f"uploads/{digest}.jpg"
+    preview_path = os.path.join(PREVIEW_FOLDER, f"{digest}.jpg")
+    
+    try:
+        if os.path.exists(upload_path) and os.path.exists(preview_path):
+            # Restart the handle's expiry since the client is about to use it
+            os.utime(upload_path)
+            metrics.incr('previews.hits')
+        else:
+            metrics.incr('previews.misses')
+            upload_path = process_uploaded_image(image_file, name=digest, preview_path=preview_path)
+            # Uploads only a fallback converter could read come back without a preview
+            if not os.path.exists(preview_path):
+                render_preview(upload_path, preview_path)
+            publish(upload_path)
+            publish(preview_path)
+    except ImageWorkersBusy:
+        return image_workers_busy()
+    except Exception as e:
+        logger.error(f"Error creating image preview: {str(e)}")
+        return jsonify({"error": f"Error processing image: {str(e)}"}), 400
+    
+    return jsonify({
+        "preview_url": f"/generated/previews/{digest}.jpg",
+        "handle": make_handle(upload_path)
+    })
+
+@main.route('/api/jobs', methods=['POST'])
+def create_job():
+    """Queue a redesign generation and return its job ID right away"""
+    try:
+        message = request_value('message')
+        if not message:
+            return jsonify({"error": "No message provided"}), 400
         
-        # Upload file to Gemini
-        uploaded_file = client.files.upload(file=image_path)
+        # Accept either an uploaded image or a handle to one we already have
+        try:
+            image_path, owned = get_request_image('image', limits=image_limits('gemini'))
+        except InvalidImageHandle as e:
+            return jsonify({"error": str(e)}), 404
+        except ImageWorkersBusy:
+            return image_workers_busy()
+        except Exception as e:
+            return jsonify({"error": f"Error processing image: {str(e)}"}), 400
+        if not image_path:
+            return jsonify({"error": "No image provided"}), 400
         
-        # Initialize the model
-        model = "gemini-2.0-flash-exp-image-generation"
+        try:
+            job = job_manager.submit(run_generation_job, image_path, message,
+                                     cleanup=owned, kind='generation')
+        except JobQueueFull as e:
+            logger.warning(f"Rejecting generation job: {str(e)}")
+            if owned:
+                os.remove(image_path)
+            return jsonify({"error": "Server is busy, please try again shortly"}), 503
         
-        # Create content with image and text
-        contents = [
-            types.Content(
-                role="user",
-                parts=[
-                    types.Part.from_uri(
-                        file_uri=uploaded_file.uri,
-                        mime_type=uploaded_file.mime_type,
-                    ),
-                    types.Part.from_text(text=message),
-                ],
-            ),
-        ]
+        response = job.to_dict()
+        response["status_url"] = f"/api/jobs/{job.id}"
+        response["events_url"] = f"/api/jobs/{job.id}/events"
+        return jsonify(response), 202
+    
+    except Exception as e:
+        logger.exception(f"Error creating job: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@main.route('/api/jobs/batch', methods=['POST'])
+def create_batch_jobs():
+    """Render several suggestions for one image concurrently, streaming each result as it finishes"""
+    try:
+        messages = [m for m in request.form.getlist('message') if m.strip()]
+        if not messages:
+            return jsonify({"error": "No messages provided"}), 400
+        if len(messages) > current_app.config['BATCH_MAX_ITEMS']:
+            return jsonify({"error": f"At most {current_app.config['BATCH_MAX_ITEMS']} messages per batch"}), 400
         
-        # Configure generation
-        generate_content_config = types.GenerateContentConfig(
-            temperature=1,
-            top_p=0.95,
-            top_k=40,
-            max_output_tokens=8192,
-            response_modalities=["image", "text"],
-            response_mime_type="text/plain",
-        )
+        # Decode the image once (or reuse a handle) and share it between every render
+        try:
+            image_path, owned = get_request_image('image', limits=image_limits('gemini'))
+        except InvalidImageHandle as e:
+            return jsonify({"error": str(e)}), 404
+        except ImageWorkersBusy:
+            return image_workers_busy()
+        except Exception as e:
+            return jsonify({"error": f"Error processing image: {str(e)}"}), 400
+        if not image_path:
+            return jsonify({"error": "No image provided"}), 400
         
-        # List to store generated image names
-        generated_images = []
-        response_text = ""
+        jobs = []
+        try:
+            for message in messages:
+                jobs.append(job_manager.submit(run_generation_job, image_path, message,
+                                               cleanup=False, kind='generation'))
+        except JobQueueFull as e:
+            logger.warning(f"Batch only partially queued: {str(e)}")
+            if not jobs:
+                if owned:
+                    os.remove(image_path)
+                return jsonify({"error": "Server is busy, please try again shortly"}), 503
         
-        # Stream response to capture both text and images
-        for chunk in client.models.generate_content_stream(
-            model=model,
-            contents=contents,
-            config=generate_content_config,
-        ):
-            if not chunk.candidates or not chunk.candidates[0].content or not chunk.candidates[0].content.parts:
-                continue
-                
-            part = chunk.candidates[0].content.parts[0]
-            
-            # If chunk contains image data
-            if hasattr(part, 'inline_data') and part.inline_data:
-                file_name = f"generated/image_{uuid.uuid4()}"
-                inline_data = part.inline_data
-                file_extension = mimetypes.guess_extension(inline_data.mime_type) or ".png"
-                full_path = f"{file_name}{file_extension}"
-                
-                # Save the image
-                with open(full_path, "wb") as f:
-                    f.write(inline_data.data)
-                
-                # Get the filename without the full path
-                filename = os.path.basename(full_path)
-                
-                # Add to list of generated images (web path)
-                # Use a relative URL that can be served by Flask
-                image_web_path = f"/generated/{filename}"
-                generated_images.append(image_web_path)
-                
-                print(f"Generated image saved to: {full_path}")
-                print(f"Image will be served at: {image_web_path}")
-                
-                # Double check file exists
-                if os.path.exists(full_path):
-                    print(f"Confirmed file exists at: {full_path}")
-                else:
-                    print(f"WARNING: File does not exist at: {full_path}")
-            else:
-                # Accumulate text response
-                if hasattr(chunk, 'text'):
-                    response_text += chunk.text
+        if owned:
+            remove_when_finished([job.future for job in jobs], image_path)
+        index_by_future = {job.future: index for index, job in enumerate(jobs)}
         
-        # Clean up the uploaded file
-        os.remove(image_path)
+        def generate():
+            queued = [{"index": index, "job_id": job.id} for index, job in enumerate(jobs)]
+            yield sse_event("queued", {"jobs": queued, "requested": len(messages)})
+            
+            # Messages that didn't fit in the queue fail now rather than never reporting back
+            for index in range(len(jobs), len(messages)):
+                yield sse_event("result", {"index": index, "status": JOB_FAILED,
+                                           "error": "Server is busy, please try again shortly"})
+            
+            pending = set(index_by_future)
+            while pending:
+                done, pending = futures_wait(pending, timeout=15, return_when=FIRST_COMPLETED)
+                if not done:
+                    # Nothing finished yet, keep the connection alive
+                    yield ": keep-alive\n\n"
+                    continue
+                for future in done:
+                    job = future.result()
+                    payload = job.to_dict()
+                    payload["index"] = index_by_future[future]
+                    yield sse_event("result", payload)
+            
+            yield sse_event("done", {})
         
-        return jsonify({
-            "text": response_text,
-            "images": generated_images
+        return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
         })
     
     except Exception as e:
-        print(f"Error in image generation: {str(e)}")
+        logger.exception(f"Error creating batch jobs: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-def process_uploaded_image(file, prefix=""):
-    """Process an uploaded image file, handling various formats including HEIC/HEIF."""
+@main.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get job status, optionally long-polling with ?wait=<seconds>&since=<version>"""
+    wait = min(request.args.get('wait', 0, type=float), current_app.config['JOB_MAX_WAIT_SECONDS'])
+    since = request.args.get('since', type=int)
+    
+    if wait > 0:
+        job = job_manager.wait(job_id, since_version=since, timeout=wait)
+    else:
+        job = job_manager.get(job_id)
+    
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@main.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Stream job progress as Server-Sent Events until the job finishes"""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    
+    if not current_app.config['JOB_MAX_WAIT_SECONDS']:
+        # Requests mustn't block this server, so send the current state and let EventSource reconnect
+        event = sse_event('done' if job.finished else 'progress', job.to_dict())
+        return Response(f"retry: 2000\n{event}", mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    
+    def generate():
+        version = None
+        while True:
+            job = job_manager.wait(job_id, since_version=version, timeout=15)
+            if job is None:
+                return
+            if version is not None and job.version == version:
+                # Nothing new, keep the connection alive
+                yield ": keep-alive\n\n"
+                continue
+            version = job.version
+            yield sse_event('done' if job.finished else 'progress', job.to_dict())
+            if job.finished:
+                return
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def render_preview(image_path, preview_path):
+    """Write a small progressive JPEG of an image for the browser to display"""
+    image_workers.run(write_preview, image_path, preview_path,
+                      current_app.config['PREVIEW_MAX_EDGE'], current_app.config['PREVIEW_QUALITY'])
+
+def storage_key(path, folders=STORED_FOLDERS):
+    """Storage key for a local file, e.g. 'generated/image_x.png'.
+    
+    Paths can come from clients, so anything that doesn't resolve to a file
+    in one of folders raises ValueError.
+    """
+    key = os.path.relpath(os.path.abspath(path)).replace(os.sep, '/')
+    folder, _, name = key.partition('/')
+    if folder not in folders or not name:
+        raise ValueError(f"Invalid file path: {path}")
+    return key
+
+def publish(path, content_type=None):
+    """Copy a file we wrote locally to storage without making the request wait"""
+    storage.put_async(storage_key(path), path, content_type=content_type)
+
+def ensure_local(path, folders=STORED_FOLDERS):
+    """True if path exists locally, fetching it from storage if another instance wrote it.
+    
+    Paths outside folders are never looked up, here or in storage.
+    """
+    try:
+        key = storage_key(path, folders)
+    except ValueError as e:
+        logger.warning(str(e))
+        return False
+    if os.path.exists(key):
+        return True
+    if not storage.remote:
+        return False
+    try:
+        return storage.fetch(key, key)
+    except Exception as e:
+        logger.error(f"Error fetching {path} from storage: {str(e)}")
+        return False
+
+def render_download(image_path):
+    """Path of the JPEG users download for an image, rendering it on first request"""
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    download_path = os.path.join(DOWNLOAD_FOLDER, f"{stem}.jpg")
+    try:
+        if os.path.getmtime(download_path) >= os.path.getmtime(image_path):
+            metrics.incr('downloads.renditions.hits')
+            return download_path
+    except FileNotFoundError:
+        pass
+    
+    metrics.incr('downloads.renditions.misses')
+    image_workers.run(write_download, image_path, download_path, 95)
+    return download_path
+
+def process_uploaded_image(file, prefix="", name=None, limits=None, preview_path=None):
+    """Process an uploaded image file, handling various formats including HEIC/HEIF.
+
+    With limits (a ModelImageLimits) the bytes for that model, and with
+    preview_path a browser preview, are made from the same decode.
+    """
     # Generate a unique filename with optional prefix
     original_filename = file.filename
     extension = os.path.splitext(original_filename)[1].lower()
@@ -350,197 +824,125 @@ def process_uploaded_image(file, prefix=""):
     is_heic = extension in ['.heic', '.heif'] or (file.content_type and ('heic' in file.content_type.lower() or 'heif' in file.content_type.lower()))
     
     if is_heic:
-        print(f"Detected HEIC image: {original_filename}")
-        print("Attempting to convert HEIC to JPEG...")
+        logger.info(f"Detected HEIC image: {original_filename}")
+        logger.info("Attempting to convert HEIC to JPEG...")
         
-    # Save the original file to a temporary location
-    with tempfile.NamedTemporaryFile(delete=False, suffix=extension) as temp:
-        file.save(temp.name)
-        temp_path = temp.name
-    
-    # Generate output path with standard extension and prefix
-    output_path = f"uploads/{prefix}{uuid.uuid4()}.jpg"
+    # Generate output path with standard extension and prefix, unless the caller names it
+    output_path = f"uploads/{name or f'{prefix}{uuid.uuid4()}'}.jpg"
     
     # Ensure the uploads directory exists
     os.makedirs("uploads", exist_ok=True)
     
+    # The upload is already buffered in memory, so decode straight from it
+    stream = upload_stream(file)
+    temp_path = None
+    
     try:
         # Try opening the image with PIL first
         try:
-            with Image.open(temp_path) as img:
-                # Convert to RGB if needed
-                if img.mode in ('RGBA', 'LA'):
-                    print(f"Converting image from {img.mode} to RGB")
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    background.paste(img, mask=img.split()[3] if img.mode == 'RGBA' else img.split()[1])
-                    img = background
-                elif img.mode != 'RGB':
-                    print(f"Converting image from {img.mode} to RGB")
-                    img = img.convert('RGB')
-                
-                # Save as JPEG
-                img.save(output_path, format='JPEG', quality=95)
-                print(f"Image processed and saved to {output_path}")
-                
-                # Clean up temp file
-                os.remove(temp_path)
-                return output_path
-                
-        except Exception as img_error:
-            print(f"Error opening image with PIL: {str(img_error)}")
+            # Decode and flatten to RGB once, save as JPEG and derive what later steps need.
+            # A worker process is sent the bytes once; inline, the decoder reads the buffer directly.
+            source = stream if image_workers.inline else stream.read()
+            preview = None
+            if preview_path:
+                preview = (preview_path, current_app.config['PREVIEW_MAX_EDGE'], current_app.config['PREVIEW_QUALITY'])
+            store_upload(source, output_path, limits=limits, preview=preview)
+            logger.info(f"Image processed and saved to {output_path}")
+            return output_path
+            
+        except ImageWorkersBusy:
+            # Includes ImageWorkersUnavailable: the pool failed, not the image, so don't fall back
+            raise
+        except DECODE_ERRORS as img_error:
+            logger.warning(f"Error opening image with PIL: {str(img_error)}")
             
-            # If this is a HEIC image, try external conversion tools
+            # If this is a HEIC image and we can't decode it natively, try external conversion tools
             if is_heic:
-                print("Trying external tools for HEIC conversion...")
-                
-                # Try different conversion methods depending on platform
-                conversion_success = False
-                
-                # Try method 1: Use sips (macOS)
-                if not conversion_success and sys.platform == 'darwin':
-                    try:
-                        print("Trying sips for conversion (macOS)...")
-                        subprocess.run(['sips', '-s', 'format', 'jpeg', '-s', 'formatOptions', 'best', 
-                                        temp_path, '--out', output_path], 
-                                       check=True, capture_output=True)
-                        conversion_success = os.path.exists(output_path)
-                        if conversion_success:
-                            print("HEIC conversion with sips succeeded")
-                    except Exception as e:
-                        print(f"sips conversion failed: {str(e)}")
+                if not available_heic_converters():
+                    raise ValueError("Unable to convert HEIC image. Please convert it to JPEG before uploading.")
                 
-                # Try method 2: Use ImageMagick if available
-                if not conversion_success:
-                    try:
-                        print("Trying ImageMagick for conversion...")
-                        subprocess.run(['convert', temp_path, output_path], 
-                                      check=True, capture_output=True)
-                        conversion_success = os.path.exists(output_path)
-                        if conversion_success:
-                            print("HEIC conversion with ImageMagick succeeded")
-                    except Exception as e:
-                        print(f"ImageMagick conversion failed: {str(e)}")
+                logger.info("Trying external tools for HEIC conversion...")
                 
-                # Try method 3: Use heif-convert if available
-                if not conversion_success:
-                    try:
-                        print("Trying heif-convert for conversion...")
-                        subprocess.run(['heif-convert', temp_path, output_path], 
-                                      check=True, capture_output=True)
-                        conversion_success = os.path.exists(output_path)
-                        if conversion_success:
-                            print("HEIC conversion with heif-convert succeeded")
-                    except Exception as e:
-                        print(f"heif-convert conversion failed: {str(e)}")
+                # The converters need a real file, so only now write one
+                stream.seek(0)
+                with tempfile.NamedTemporaryFile(delete=False, suffix=extension) as temp:
+                    shutil.copyfileobj(stream, temp)
+                    temp_path = temp.name
                 
-                # If any conversion method worked, return the output path
-                if conversion_success:
-                    # Clean up temp file
-                    os.remove(temp_path)
+                if convert_heic(temp_path, output_path):
                     return output_path
-                else:
-                    # If all conversions failed, notify the user but don't hard error
-                    print("All HEIC conversion methods failed")
-                    os.remove(temp_path)
-                    raise ValueError("Unable to convert HEIC image. Please convert it to JPEG before uploading.")
+                
+                # If all conversions failed, notify the user but don't hard error
+                logger.error("All HEIC conversion methods failed")
+                raise ValueError("Unable to convert HEIC image. Please convert it to JPEG before uploading.")
             
             # For non-HEIC images that PIL couldn't open, try a generic approach
-            print("Trying to handle as a generic image format...")
+            logger.info("Trying to handle as a generic image format...")
             
             # For non-HEIC images, we can try using a different approach or format
             if not is_heic:
                 # Copy the file with a more common extension
-                with open(temp_path, 'rb') as src_file:
-                    with open(output_path, 'wb') as dest_file:
-                        dest_file.write(src_file.read())
-                print(f"File copied to {output_path} - will attempt to process")
-                
-                # Clean up temp file
-                os.remove(temp_path)
+                stream.seek(0)
+                with open(output_path, 'wb') as dest_file:
+                    shutil.copyfileobj(stream, dest_file)
+                logger.info(f"File copied to {output_path} - will attempt to process")
                 return output_path
             else:
                 raise ValueError("Unsupported image format. Please upload JPEG, PNG, or GIF images.")
                 
     except Exception as e:
-        # Clean up temp file if still exists
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-        print(f"Error processing uploaded image: {str(e)}")
+        logger.exception(f"Error processing uploaded image: {str(e)}")
         raise
+    finally:
+        # Clean up temp file if one was needed
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
 
-def make_claude_request(url, headers, payload, max_retries=3, initial_delay=1):
-    for attempt in range(max_retries):
-        try:
-            claude_response = requests.post(url, headers=headers, json=payload)
-            
-            # If successful, return the response
-            if claude_response.status_code == 200:
-                return claude_response
-                
-            # If overloaded, wait and retry
-            if claude_response.status_code == 529:
-                if attempt < max_retries - 1:  # Don't sleep on the last attempt
-                    delay = initial_delay * (2 ** attempt) + random.uniform(0, 0.1)  # exponential backoff with jitter
-                    print(f"Claude API overloaded, retrying in {delay:.1f} seconds...")
-                    time.sleep(delay)
-                    continue
-                    
-            # For other errors, raise immediately
-            claude_response.raise_for_status()
-            
-        except Exception as e:
-            if attempt < max_retries - 1:
-                delay = initial_delay * (2 ** attempt) + random.uniform(0, 0.1)
-                print(f"Error making Claude API request: {str(e)}, retrying in {delay:.1f} seconds...")
-                time.sleep(delay)
-                continue
-            raise
-    
-    # If we get here, all retries failed
-    raise Exception(f"Claude API still overloaded after {max_retries} retries")
-
-@app.route('/api/claude-suggestions', methods=['POST'])
+@main.route('/api/claude-suggestions', methods=['POST'])
 @auth_required
 def claude_suggestions():
     """Get redesign suggestions from Claude"""
     original_path = None
     inspiration_path = None
-        
+    
     try:
-        # Check if required files are in request
-        if 'original' not in request.files or 'inspiration' not in request.files:
-            return jsonify({"error": "Both original and inspiration images are required"}), 400
-        
-        # Get files
-        original_file = request.files['original']
-        inspiration_file = request.files['inspiration']
+        # Each image may be an upload or a handle to one we already have
+        try:
+            original_path, original_owned = get_request_image('original', limits=image_limits('claude'))
+            inspiration_path, inspiration_owned = get_request_image('inspiration', limits=image_limits('claude'))
+        except InvalidImageHandle as e:
+            return jsonify({"error": str(e)}), 404
+        except ImageWorkersBusy:
+            return image_workers_busy()
+        except Exception as e:
+            return jsonify({"error": f"Error processing image: {str(e)}"}), 400
         
-        # Validate files
-        for file in [original_file, inspiration_file]:
-            if file.filename == '':
-                return jsonify({"error": "No file selected"}), 400
+        if not original_path or not inspiration_path:
+            return jsonify({"error": "Both original and inspiration images are required"}), 400
         
-        # Save files to temporary locations
-        original_path = os.path.join('uploads', f"{uuid.uuid4()}.jpg")
-        inspiration_path = os.path.join('uploads', f"{uuid.uuid4()}.jpg")
+        # Fresh uploads are kept as handles, so copy them to storage for other instances
+        if original_owned:
+            publish(original_path)
+        if inspiration_owned:
+            publish(inspiration_path)
         
-        logger.info(f"Saving original image to {original_path}")
-        original_file.save(original_path)
+        logger.info(f"Using original image {original_path} and inspiration image {inspiration_path}")
         
-        logger.info(f"Saving inspiration image to {inspiration_path}")
-        inspiration_file.save(inspiration_path)
+        # Identical image pairs get identical answers, so serve repeats from cache
+        cache_key = suggestion_cache_key(original_path, inspiration_path)
+        cached_suggestions = suggestion_cache.get(cache_key)
+        if cached_suggestions:
+            logger.info("Serving suggestions from cache")
+            redesign_id = track_usage(request, original_path, inspiration_path)
+            if not redesign_id:
+                logger.error("Failed to track usage")
+            return jsonify(suggestions_result(cached_suggestions, original_path, inspiration_path, redesign_id,
+                                              cached=True))
         
         # Process with Claude
         try:
             logger.info("Setting up Claude API request")
             
-            # Get the anthropic client
-            headers = {
-                "x-api-key": CLAUDE_API_KEY,
-                "anthropic-version": "2023-06-01",
-                "content-type": "application/json"
-            }
-            
             # Log the API key length (without revealing the key)
             if CLAUDE_API_KEY:
                 logger.info(f"Claude API key present (length: {len(CLAUDE_API_KEY)})")
@@ -554,66 +956,28 @@ def claude_suggestions():
             # Prepare images for Claude with compression if needed
             logger.info("Encoding images for Claude API")
             try:
-                original_b64 = encode_image(original_path)
-                inspiration_b64 = encode_image(inspiration_path)
+                payload = build_suggestions_payload(original_path, inspiration_path)
                 logger.info("Images encoded successfully")
+            except ImageWorkersBusy:
+                return image_workers_busy()
             except Exception as e:
                 logger.error(f"Error encoding images: {str(e)}")
                 return jsonify({"error": f"Error processing images: {str(e)}"}), 500
             
-            # Create the prompt
-            prompt_text = f"""You're the world's greatest interior designer. I'll show you two images:
-1. The first is a room I want to redesign
-2. The second is an inspiration image with a style I like
-
-Please suggest 3 different ways to redesign my room based on the inspiration image.
-For each suggestion, provide:
-- A clear, specific title (10 words or less)
-- A detailed description with color schemes, furniture placement, etc. (150-250 words)
-"""
-            
-            # Prepare the request
-            payload = {
-                "model": CLAUDE_MODEL,
-                "max_tokens": 1000,
-                "temperature": 0.7,
-                "messages": [
-                    {
-                        "role": "user", 
-                        "content": [
-                            {"type": "text", "text": prompt_text},
-                            {"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": original_b64}},
-                            {"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": inspiration_b64}}
-                        ]
-                    }
-                ]
-            }
-            
             logger.info("Sending request to Claude API with 90 second timeout")
+            # Don't keep a database connection idle while Claude works
+            release_connection()
             try:
-                response = requests.post(
-                    "https://api.anthropic.com/v1/messages",
-                    headers=headers,
-                    json=payload,
-                    timeout=90  # Increase timeout to 90 seconds
-                )
+                response = claude_client.create_message(payload, read_timeout=90)
                 
                 # Log response status and headers
                 logger.info(f"Claude API response status: {response.status_code}")
                 logger.info(f"Claude API response headers: {response.headers}")
                 
                 # Check for common error status codes
-                if response.status_code == 429:
-                    logger.error("Claude API rate limit exceeded")
-                    return jsonify({"error": "Rate limit exceeded. Please try again later."}), 429
-                elif response.status_code == 401:
-                    logger.error("Claude API authentication failed")
-                    return jsonify({"error": "API authentication failed."}), 500
-                elif response.status_code != 200:
-                    # Log the error response text
-                    error_text = response.text
-                    logger.error(f"Claude API error: {response.status_code} - {error_text[:200]}")
-                    return jsonify({"error": f"Error from Claude API: {response.status_code}"}), 500
+                error_response = claude_error_response(response)
+                if error_response:
+                    return error_response
                 
                 # Try to parse the JSON response
                 try:
@@ -637,12 +1001,17 @@ For each suggestion, provide:
                 suggestions = parse_suggestions(suggestions_text)
                 logger.info(f"Parsed {len(suggestions)} suggestions")
                 
+                # Only cache real answers, not our placeholders
+                if not has_fallbacks(suggestions):
+                    suggestion_cache.put(cache_key, suggestions, CLAUDE_MODEL, PROMPT_VERSION)
+                
                 # Track usage
-                if not track_usage(request, original_path, inspiration_path):
+                redesign_id = track_usage(request, original_path, inspiration_path)
+                if not redesign_id:
                     logger.error("Failed to track usage")
                 
-                # Return suggestions to client
-                return jsonify({"suggestions": suggestions})
+                # Return suggestions and image handles so later steps don't re-upload
+                return jsonify(suggestions_result(suggestions, original_path, inspiration_path, redesign_id))
                 
             except requests.exceptions.Timeout:
                 logger.error("Claude API request timed out after 90 seconds")
@@ -662,20 +1031,193 @@ For each suggestion, provide:
     except Exception as e:
         logger.exception(f"Error in claude_suggestions: {str(e)}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        # Clean up temporary files
+
+@main.route('/api/claude-suggestions/stream', methods=['POST'])
+@auth_required
+def claude_suggestions_stream():
+    """Stream redesign suggestions from Claude as Server-Sent Events, one per completed suggestion"""
+    try:
+        # Each image may be an upload or a handle to one we already have
+        try:
+            original_path, original_owned = get_request_image('original', limits=image_limits('claude'))
+            inspiration_path, inspiration_owned = get_request_image('inspiration', limits=image_limits('claude'))
+        except InvalidImageHandle as e:
+            return jsonify({"error": str(e)}), 404
+        except ImageWorkersBusy:
+            return image_workers_busy()
+        except Exception as e:
+            return jsonify({"error": f"Error processing image: {str(e)}"}), 400
+        
+        if not original_path or not inspiration_path:
+            return jsonify({"error": "Both original and inspiration images are required"}), 400
+        
+        # Fresh uploads are kept as handles, so copy them to storage for other instances
+        if original_owned:
+            publish(original_path)
+        if inspiration_owned:
+            publish(inspiration_path)
+        
+        # A cached answer is streamed straight back without calling Claude
+        cache_key = suggestion_cache_key(original_path, inspiration_path)
+        cached_suggestions = suggestion_cache.get(cache_key)
+        if cached_suggestions:
+            logger.info("Streaming suggestions from cache")
+            
+            def generate_cached():
+                for index, suggestion in enumerate(cached_suggestions):
+                    yield sse_event("suggestion", {"index": index, "suggestion": suggestion})
+                redesign_id = track_usage(request, original_path, inspiration_path)
+                if not redesign_id:
+                    logger.error("Failed to track usage")
+                yield sse_event("done", suggestions_result(cached_suggestions, original_path, inspiration_path,
+                                                           redesign_id, cached=True))
+            
+            return Response(stream_with_context(generate_cached()), mimetype='text/event-stream', headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            })
+        
+        if not CLAUDE_API_KEY:
+            logger.error("Claude API key is empty or not set")
+            return jsonify({"error": "API configuration error"}), 500
+        
         try:
-            if original_path and os.path.exists(original_path):
-                os.remove(original_path)
-                logger.info(f"Removed temporary file: {original_path}")
-            if inspiration_path and os.path.exists(inspiration_path):
-                os.remove(inspiration_path)
-                logger.info(f"Removed temporary file: {inspiration_path}")
+            payload = build_suggestions_payload(original_path, inspiration_path, stream=True)
+        except ImageWorkersBusy:
+            return image_workers_busy()
         except Exception as e:
-            logger.error(f"Error cleaning up temporary files: {str(e)}")
+            logger.error(f"Error encoding images: {str(e)}")
+            return jsonify({"error": f"Error processing images: {str(e)}"}), 500
+        
+        # Don't keep a database connection idle while Claude works
+        release_connection()
+        
+        # Errors before the first byte are still reported as plain JSON
+        try:
+            response = claude_client.create_message(payload, read_timeout=90, stream=True)
+        except requests.exceptions.Timeout:
+            logger.error("Claude API request timed out")
+            return jsonify({"error": "The Claude API request timed out. Please try again later."}), 504
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Claude API request error: {str(e)}")
+            return jsonify({"error": f"Error connecting to Claude API: {str(e)}"}), 502
+        
+        error_response = claude_error_response(response)
+        if error_response:
+            response.close()
+            return error_response
+        
+        def generate():
+            parser = SuggestionStreamParser()
+            try:
+                for event in iter_stream_events(response):
+                    if event.get("type") == "error":
+                        logger.error(f"Claude stream error: {event.get('error')}")
+                        yield sse_event("error", {"error": "Error from Claude API"})
+                        return
+                    
+                    delta = event.get("delta") or {}
+                    if event.get("type") != "content_block_delta" or delta.get("type") != "text_delta":
+                        continue
+                    
+                    # Push each suggestion the moment its text is complete
+                    index = parser.emitted
+                    for suggestion in parser.feed(delta.get("text", "")):
+                        yield sse_event("suggestion", {"index": index, "suggestion": suggestion})
+                        index += 1
+                
+                suggestions, remaining = parser.finish()
+                index = len(suggestions) - len(remaining)
+                for suggestion in remaining:
+                    yield sse_event("suggestion", {"index": index, "suggestion": suggestion})
+                    index += 1
+                logger.info(f"Streamed {len(suggestions)} suggestions")
+                
+                # Only cache real answers, not our placeholders
+                if not has_fallbacks(suggestions):
+                    suggestion_cache.put(cache_key, suggestions, CLAUDE_MODEL, PROMPT_VERSION)
+                
+                # Track usage
+                redesign_id = track_usage(request, original_path, inspiration_path)
+                if not redesign_id:
+                    logger.error("Failed to track usage")
+                
+                yield sse_event("done", suggestions_result(suggestions, original_path, inspiration_path, redesign_id))
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Claude stream interrupted: {str(e)}")
+                yield sse_event("error", {"error": "The Claude API stream was interrupted. Please try again."})
+            finally:
+                response.close()
+        
+        return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+    
+    except Exception as e:
+        logger.exception(f"Error in claude_suggestions_stream: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def suggestion_cache_key(original_path, inspiration_path):
+    """Cache key for a pair of processed images under the current model and prompt"""
+    return SuggestionCache.make_key(file_sha256(original_path), file_sha256(inspiration_path),
+                                    CLAUDE_MODEL, PROMPT_VERSION)
+
+def suggestions_result(suggestions, original_path, inspiration_path, redesign_id, cached=False):
+    """Suggestions plus image handles so later steps don't re-upload, and the redesign to save results to"""
+    return {
+        "suggestions": suggestions,
+        "redesign_id": redesign_id,
+        "original_handle": make_handle(original_path),
+        "inspiration_handle": make_handle(inspiration_path),
+        "cached": cached
+    }
+
+def build_suggestions_payload(original_path, inspiration_path, stream=False):
+    """Encode both images and build the Claude request for redesign suggestions"""
+    original_b64, original_media_type = encode_image(original_path)
+    inspiration_b64, inspiration_media_type = encode_image(inspiration_path)
+    
+    payload = {
+        "model": CLAUDE_MODEL,
+        "max_tokens": 1000,
+        "temperature": 0.7,
+        "messages": [
+            {
+                "role": "user", 
+                "content": [
+                    {"type": "text", "text": SUGGESTIONS_PROMPT},
+                    {"type": "image", "source": {"type": "base64", "media_type": original_media_type, "data": original_b64}},
+                    {"type": "image", "source": {"type": "base64", "media_type": inspiration_media_type, "data": inspiration_b64}}
+                ]
+            }
+        ]
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+def claude_error_response(response):
+    """Map a non-200 Claude response to the error we return, or None if it succeeded"""
+    if response.status_code == 429:
+        logger.error("Claude API rate limit exceeded")
+        return jsonify({"error": "Rate limit exceeded. Please try again later."}), 429
+    elif response.status_code == 401:
+        logger.error("Claude API authentication failed")
+        return jsonify({"error": "API authentication failed."}), 500
+    elif response.status_code != 200:
+        # Log the error response text
+        error_text = response.text
+        logger.error(f"Claude API error: {response.status_code} - {error_text[:200]}")
+        return jsonify({"error": f"Error from Claude API: {response.status_code}"}), 500
+    return None
+
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 def track_usage(request, original_path, inspiration_path):
-    """Track usage of the redesign service"""
+    """Track usage of the redesign service. Returns the new redesign's ID, or None if it wasn't recorded."""
     try:
         # Get user info
         user_id = None
@@ -713,167 +1255,57 @@ def track_usage(request, original_path, inspiration_path):
         else:
             logger.error("Failed to create redesign record")
             
-        return success
+        return redesign_id
     except Exception as e:
         logger.error(f"Error tracking usage: {str(e)}")
         logger.error(traceback.format_exc())
-        return False
+        return None
 
-# Helper function to encode images for Claude with size check and compression
+# Helper function to pick the media type Claude should be told an image has
+def image_media_type(image_path):
+    return mimetypes.guess_type(image_path)[0] or "image/jpeg"
+
+# Helper function to encode images for Claude, downscaled to the resolution it actually uses
 def encode_image(image_path):
-    """Encode an image to base64, with optional resizing to meet Claude's limits"""
+    """Encode an image to base64 for Claude. Returns (base64 data, media type)."""
     try:
-        # Check file size
-        file_size = os.path.getsize(image_path) / (1024 * 1024)  # Size in MB
-        logger.info(f"Original image size: {file_size:.2f} MB")
-        
-        if file_size > 4.5:  # Claude has a 5MB limit, using 4.5 to be safe
-            logger.info("Image too large, compressing...")
-            try:
-                # Open and compress the image
-                img = Image.open(image_path)
-                
-                # Convert to RGB if needed
-                if img.mode in ('RGBA', 'LA'):
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    background.paste(img, mask=img.split()[3] if img.mode == 'RGBA' else img.split()[1])
-                    img = background
-                elif img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Start with decent quality
-                quality = 85
-                max_size = (1600, 1600)  # Reasonable max dimensions
-                
-                # Resize the image if it's too large
-                if img.width > max_size[0] or img.height > max_size[1]:
-                    img.thumbnail(max_size, Image.LANCZOS)
-                    logger.info(f"Resized image to {img.width}x{img.height}")
-                
-                # Create a BytesIO object to check the compressed size
-                img_byte_arr = io.BytesIO()
-                img.save(img_byte_arr, format='JPEG', quality=quality)
-                compressed_size = len(img_byte_arr.getvalue()) / (1024 * 1024)
-                
-                # If still too large, reduce quality iteratively
-                while compressed_size > 4.5 and quality > 30:
-                    quality -= 10
-                    img_byte_arr = io.BytesIO()
-                    img.save(img_byte_arr, format='JPEG', quality=quality)
-                    compressed_size = len(img_byte_arr.getvalue()) / (1024 * 1024)
-                    logger.info(f"Reduced quality to {quality}, new size: {compressed_size:.2f} MB")
-                
-                # If still too large, reduce dimensions
-                while compressed_size > 4.5 and max_size[0] > 800:
-                    max_size = (int(max_size[0] * 0.8), int(max_size[1] * 0.8))
-                    img.thumbnail(max_size, Image.LANCZOS)
-                    img_byte_arr = io.BytesIO()
-                    img.save(img_byte_arr, format='JPEG', quality=quality)
-                    compressed_size = len(img_byte_arr.getvalue()) / (1024 * 1024)
-                    logger.info(f"Resized to {img.width}x{img.height}, new size: {compressed_size:.2f} MB")
-                
-                # Get the base64 encoded string from the compressed image
-                img_byte_arr.seek(0)
-                return base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
-                
+        try:
+            data, media_type = prepare_for_model(image_path, image_limits('claude'))
+        except ImageWorkersBusy:
+            raise
         except Exception as e:
-                logger.error(f"Error compressing image: {str(e)}")
-                # Fall back to original file if compression fails
+            logger.error(f"Error preparing image for Claude: {str(e)}")
+            # Fall back to original file if downscaling fails
+            with open(image_path, "rb") as image_file:
+                data, media_type = image_file.read(), image_media_type(image_path)
         
-        # If file size is acceptable or compression failed, use the original file
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+        return base64.b64encode(data).decode('utf-8'), media_type
         
     except Exception as e:
         logger.error(f"Error encoding image: {str(e)}")
         raise
 
-# Helper function to parse suggestions from Claude
-def parse_suggestions(text):
-    suggestions = []
-    current_suggestion = None
-    
-    try:
-        # Split by suggestion numbers
-        parts = re.split(r'\n\s*(?:Suggestion |)\d+[\.:]\s*', text)
-        
-        # Remove any empty parts and the first part if it's just an intro
-        parts = [p.strip() for p in parts if p.strip()]
-        if len(parts) > 3 and len(parts[0]) < 100:  # The first part is likely an intro
-            parts = parts[1:]
-        
-        # Take up to 3 suggestions
-        parts = parts[:3]
-        
-        for i, part in enumerate(parts):
-            lines = part.split('\n')
-            title = None
-            description = []
-            
-            # First non-empty line is the title
-            for line in lines:
-                if line.strip() and not title:
-                    title = line.strip()
-                    # Remove any "Title:" prefix
-                    title = re.sub(r'^Title:\s*', '', title)
-                    # Remove any numbering
-                    title = re.sub(r'^\d+[\.\)]\s*', '', title)
-                elif title:
-                    # Everything after the title is the description
-                    description.append(line)
-            
-            # Join description lines
-            full_description = '\n'.join(description).strip()
-            
-            # Clean up the description
-            full_description = re.sub(r'^Description:\s*', '', full_description)
-            
-            # Add to suggestions if we have both title and description
-            if title and full_description:
-                suggestions.append({
-                    "title": title,
-                    "description": full_description
-                })
-        
-        # If we don't have exactly 3 suggestions, create dummy ones
-        while len(suggestions) < 3:
-            suggestions.append({
-                "title": f"Redesign Option {len(suggestions) + 1}",
-                "description": "I apologize, but I couldn't generate a detailed suggestion. Please try again or use one of the other redesign options."
-            })
-        
-        return suggestions[:3]  # Ensure we return exactly 3 suggestions
-        
-    except Exception as e:
-        logger.error(f"Error parsing suggestions: {str(e)}")
-        # Return default suggestions
-        return [
-            {
-                "title": "Elegant Transformation",
-                "description": "I apologize, but I couldn't parse the suggestions properly. This is a fallback suggestion. Please try again with your redesign."
-            },
-            {
-                "title": "Modern Refresh",
-                "description": "I apologize, but I couldn't parse the suggestions properly. This is a fallback suggestion. Please try again with your redesign."
-            },
-            {
-                "title": "Cozy Makeover",
-                "description": "I apologize, but I couldn't parse the suggestions properly. This is a fallback suggestion. Please try again with your redesign."
-            }
-        ]
-
-@app.route('/api/save-results', methods=['POST'])
+@main.route('/api/save-results', methods=['POST'])
 def save_results():
     try:
         data = request.json
         result_image_url = data.get('result_image')
         suggestions = data.get('suggestions', [])
         
+        # Validate everything before creating anything
+        redesign_id = data.get('redesign_id')
+        try:
+            redesign_id = int(redesign_id) if redesign_id else None
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid redesign_id"}), 400
+        if not isinstance(result_image_url, str) or not result_image_url:
+            return jsonify({"error": "result_image is required"}), 400
+        
         # Remove the leading path as we'll be reading from the filesystem
         result_file = result_image_url.replace('/generated/', 'generated/')
         
-        # Check if the result file exists
-        if not os.path.exists(result_file):
+        # Check if the result file exists, here or in storage
+        if not ensure_local(result_file, folders=('generated',)):
             print(f"Result file not found: {result_file}")
             return jsonify({"error": "Result image not found"}), 404
         
@@ -883,25 +1315,6 @@ def save_results():
             suggestion_text += f"{i+1}. {suggestion.get('title')}\n"
             suggestion_text += f"{suggestion.get('description')}\n\n"
         
-        # Instead of saving to downloads folder, create a download URL
-        # Generate a unique filename
-        import datetime
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        download_filename = f"room_redesign_{timestamp}.jpg"
-        
-        # Store the original path and generate a download URL
-        # We'll use a temporary mapping to handle the download
-        app.config.setdefault('DOWNLOAD_MAPPING', {})
-        download_id = str(uuid.uuid4())
-        app.config['DOWNLOAD_MAPPING'][download_id] = {
-            'file_path': result_file,
-            'filename': download_filename,
-            'timestamp': datetime.datetime.now()
-        }
-        
-        # Create download URL
-        download_url = f"/api/download/{download_id}"
-        
         # Get user info for tracking the result
         user_id = None
         anonymous_id = None
@@ -925,18 +1338,20 @@ def save_results():
             
         # Update redesign record with result image
         if user_id or anonymous_id:
-            from models import Redesign
-            
-            # Find the most recent redesign by this user
-            if user_id:
-                redesign = Redesign.query.filter_by(user_id=user_id).order_by(Redesign.created_at.desc()).first()
-            else:
-                redesign = Redesign.query.filter_by(anonymous_id=anonymous_id).order_by(Redesign.created_at.desc()).first()
-                
-            # If found, update with result image
-            if redesign:
-                redesign.result_image_path = result_file
-                db.session.commit()
+            if not save_result_image(result_file, user_id=user_id, anonymous_id=anonymous_id, redesign_id=redesign_id):
+                logger.warning(f"No redesign {redesign_id} owned by this caller to save the result to")
+        
+        # Instead of saving to downloads folder, create a download URL
+        # Generate a unique filename
+        import datetime
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        download_filename = f"room_redesign_{timestamp}.jpg"
+        
+        # Store the original path behind an expiring download token
+        download_id = download_store.create(result_file, download_filename)
+        
+        # Create download URL
+        download_url = f"/api/download/{download_id}"
         
         # Return success with download URL and clipboard content
         return jsonify({
@@ -950,48 +1365,57 @@ def save_results():
         print(f"Error preparing download: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/download/<download_id>', methods=['GET'])
+def save_result_image(result_file, user_id=None, anonymous_id=None, redesign_id=None):
+    """Point the caller's redesign at its saved result with a single UPDATE. Returns True if a row changed."""
+    # Only the redesign's owner may change it
+    owner = Redesign.user_id == user_id if user_id else Redesign.anonymous_id == anonymous_id
+    if redesign_id:
+        target = Redesign.id == redesign_id
+    else:
+        # Clients from before suggestions returned a redesign_id: use the owner's newest one
+        newest = db.session.query(Redesign.id).filter(owner).order_by(Redesign.created_at.desc()).limit(1)
+        target = Redesign.id == newest.scalar_subquery()
+    
+    try:
+        updated = Redesign.query.filter(target, owner).update(
+            {Redesign.result_image_path: result_file}, synchronize_session=False
+        )
+        db.session.commit()
+        return updated > 0
+    except Exception:
+        db.session.rollback()
+        raise
+
+@main.route('/api/download/<download_id>', methods=['GET'])
 def download_file(download_id):
     try:
-        # Get the file information from our mapping
-        download_mapping = app.config.get('DOWNLOAD_MAPPING', {})
-        if download_id not in download_mapping:
+        # Get the file information for this token
+        file_info = download_store.get(download_id)
+        if file_info is None:
             return "Download expired or not found", 404
         
-        file_info = download_mapping[download_id]
-        file_path = file_info['file_path']
-        filename = file_info['filename']
+        file_path = file_info.file_path
+        filename = file_info.filename
         
-        # Check if the file exists
-        if not os.path.exists(file_path):
+        # Check if the file exists, here or in storage
+        if not ensure_local(file_path):
             return "File not found", 404
             
-        # Create a high-quality JPEG version of the image
+        # A high-quality JPEG of the image, rendered once and then served from disk
         try:
-            img = Image.open(file_path)
-            
-            # Convert to RGB if needed (required for JPEG)
-            if img.mode in ('RGBA', 'LA'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                background.paste(img, mask=img.split()[3] if img.mode == 'RGBA' else img.split()[1])
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-                
-            # Create a BytesIO object to hold the image data
-            img_io = io.BytesIO()
-            img.save(img_io, format='JPEG', quality=95)
-            img_io.seek(0)
-            
-            # Remove the download mapping after use (cleanup)
-            download_mapping.pop(download_id, None)
+            try:
+                download_path = render_download(file_path)
+            except ImageWorkersBusy:
+                return image_workers_busy()
             
-            # Set headers to force download
+            # Streamed from disk with ETag, Last-Modified and Range support
             response = send_file(
-                img_io,
+                download_path,
                 as_attachment=True,
                 download_name=filename,
-                mimetype='image/jpeg'
+                mimetype='image/jpeg',
+                conditional=True,
+                etag=True
             )
             response.headers["Content-Disposition"] = f"attachment; filename={filename}"
             return response
@@ -1004,26 +1428,36 @@ def download_file(download_id):
         return str(e), 500
 
 # Serve static files from public directory
-@app.route('/<path:path>')
+@main.route('/<path:path>')
 def serve_static(path):
     return send_from_directory('public', path)
 
 # Serve generated images
-@app.route('/generated/<path:filename>')
+@main.route('/generated/<path:filename>')
 def serve_generated_image(filename):
-    print(f"Attempting to serve image: {filename}")
-    print(f"From directory: {app.config['GENERATED_FOLDER']}")
+    try:
+        key = storage_key(os.path.join('generated', filename), folders=('generated',))
+    except ValueError:
+        return "Image not found", 404
+    file_path = os.path.join(current_app.config['GENERATED_FOLDER'], filename)
     
-    file_path = os.path.join(app.config['GENERATED_FOLDER'], filename)
+    # Send clients straight to storage once our upload has succeeded, or when another instance
+    # made the file; while the upload is pending, or if it failed, only our copy exists
+    local = os.path.exists(file_path)
+    if storage.remote and (storage.is_stored(key) or not local):
+        try:
+            return redirect(storage.url(key))
+        except Exception as e:
+            logger.error(f"Error signing storage URL for {key}: {str(e)}")
     
-    if os.path.exists(file_path):
-        print(f"Image file exists at: {file_path}")
+    # Not uploaded (or local storage): serve this instance's copy
+    if local:
         return send_file(file_path)
     else:
         print(f"Image file does not exist at: {file_path}")
         return "Image not found", 404
 
-@app.route('/api/usage/count', methods=['GET'])
+@main.route('/api/usage/count', methods=['GET'])
 def get_usage_count():
     """Get the remaining anonymous usage count"""
     anonymous_id = request.cookies.get(ANONYMOUS_COOKIE_NAME)
@@ -1061,8 +1495,7 @@ def get_usage_count():
         })
     
     # Get usage count for anonymous ID
-    from models import Redesign
-    usage_count = Redesign.query.filter_by(anonymous_id=anonymous_id).count()
+    usage_count = usage_counters.get(anonymous_id=anonymous_id)
     
     return jsonify({
         "usage_count": usage_count,
@@ -1071,7 +1504,7 @@ def get_usage_count():
     })
 
 # Add a test endpoint for Claude API
-@app.route('/api/test-claude', methods=['GET'])
+@main.route('/api/test-claude', methods=['GET'])
 def test_claude():
     """Test the Claude API connection with a simple prompt"""
     try:
@@ -1085,12 +1518,6 @@ def test_claude():
         logger.info(f"Using Claude model: {CLAUDE_MODEL}")
         
         # Prepare a simple request
-        headers = {
-            "x-api-key": CLAUDE_API_KEY,
-            "anthropic-version": "2023-06-01",
-            "content-type": "application/json"
-        }
-        
         payload = {
             "model": CLAUDE_MODEL,
             "max_tokens": 100,
@@ -1105,12 +1532,7 @@ def test_claude():
         }
         
         logger.info("Sending test request to Claude API")
-        response = requests.post(
-            "https://api.anthropic.com/v1/messages",
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
+        response = claude_client.create_message(payload, read_timeout=30)
         
         # Log response details
         logger.info(f"Claude API response status: {response.status_code}")
@@ -1165,17 +1587,10 @@ def test_claude():
         logger.error(traceback.format_exc())
         return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route('/api/test-claude-simple', methods=['GET'])
+@main.route('/api/test-claude-simple', methods=['GET'])
 def test_claude_simple():
     """Simplified test of the Claude API with basic error logging"""
     try:
-        # Prepare a simple request with just text
-        headers = {
-            "x-api-key": CLAUDE_API_KEY,
-            "anthropic-version": "2023-06-01",
-            "content-type": "application/json"
-        }
-        
         # Very basic request
         payload = {
             "model": CLAUDE_MODEL,
@@ -1195,12 +1610,7 @@ def test_claude_simple():
         print(f"Using model: {CLAUDE_MODEL}")
         
         # Make a simple request with short timeout
-        response = requests.post(
-            "https://api.anthropic.com/v1/messages",
-            headers=headers,
-            json=payload,
-            timeout=10
-        )
+        response = claude_client.create_message(payload, read_timeout=10)
         
         # Return all details about the response for debugging
         return jsonify({
@@ -1219,6 +1629,9 @@ def test_claude_simple():
             "key_present": bool(CLAUDE_API_KEY)
         }), 500
 
+# The app served by gunicorn (app:app) and the flask CLI
+app = create_app()
+
 # Ensure the application listens on the port provided by Cloud Run
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
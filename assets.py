@@ -0,0 +1,45 @@
+import logging
+import os
+import re
+
+# Create a logger
+logger = logging.getLogger(__name__)
+
+# Handle kinds and the directories their files live in
+ASSET_FOLDERS = {
+    'upload': 'uploads',
+    'generated': 'generated'
+}
+
+# Only plain file names we created ourselves can be referenced
+ASSET_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_\-]+\.(jpg|jpeg|png|webp)$')
+
+
+class InvalidImageHandle(ValueError):
+    """Raised when a handle is malformed or no longer points at a file"""
+    pass
+
+
+def make_handle(path):
+    """Build an opaque handle for a file in uploads/ or generated/"""
+    folder = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    for kind, kind_folder in ASSET_FOLDERS.items():
+        if folder == kind_folder:
+            return f"{kind}:{os.path.basename(path)}"
+    raise ValueError(f"{path} is not in a handle-backed folder")
+
+
+def resolve_handle(handle, fetch=None):
+    """Turn a handle back into a file path without touching the image bytes.
+
+    fetch(path) is tried when the file isn't here, e.g. to copy it from shared storage.
+    """
+    kind, _, name = (handle or '').partition(':')
+    if kind not in ASSET_FOLDERS or not ASSET_NAME_PATTERN.match(name):
+        raise InvalidImageHandle("Invalid image handle")
+
+    path = os.path.join(ASSET_FOLDERS[kind], name)
+    if not os.path.exists(path) and not (fetch and fetch(path)):
+        raise InvalidImageHandle("Image handle has expired, please upload the image again")
+    return path
+
@@ -18,6 +18,7 @@ import logging
 
 # Import database models
 from models import db, User, Redesign
+from usage import usage_counters
 
 # Create a logger
 logger = logging.getLogger(__name__)
@@ -50,6 +51,22 @@ def is_strong_password(password):
         return False
     return True
 
+# Helper function to give an account the redesigns made before signing in
+def transfer_anonymous_redesigns(anonymous_id, user_id):
+    """Move an anonymous visitor's redesigns to a user with one UPDATE in the caller's transaction.
+
+    Returns how many moved. Callers commit, then forget() both usage counters.
+    """
+    if not anonymous_id:
+        return 0
+    moved = Redesign.query.filter_by(anonymous_id=anonymous_id).update(
+        {Redesign.user_id: user_id, Redesign.anonymous_id: None},
+        synchronize_session=False
+    )
+    if moved:
+        usage_counters.transfer(anonymous_id, user_id, moved)
+    return moved
+
 # Decorator to check if user is authenticated or has anonymous uses left
 def auth_required(f):
     @wraps(f)
@@ -71,7 +88,7 @@ def auth_required(f):
         
         # If anonymous ID exists, check usage count
         if anonymous_id:
-            usage_count = Redesign.query.filter_by(anonymous_id=anonymous_id).count()
+            usage_count = usage_counters.get(anonymous_id=anonymous_id)
             
             # If under limit, allow request
             if usage_count < MAX_ANONYMOUS_USAGE:
@@ -136,9 +153,17 @@ def register():
         new_user = User(email=email)
         new_user.password = password  # This uses the password setter which hashes the password
         
-        # Add user to database
+        # Add user to database; flushing assigns the ID without ending the transaction
         db.session.add(new_user)
+        db.session.flush()
+        
+        # If user had anonymous redesigns, associate them with the new account in the same transaction
+        anonymous_id = request.cookies.get(ANONYMOUS_COOKIE_NAME)
+        moved = transfer_anonymous_redesigns(anonymous_id, new_user.id)
         db.session.commit()
+        if moved:
+            usage_counters.forget(anonymous_id=anonymous_id)
+            usage_counters.forget(user_id=new_user.id)
         
         # Create tokens
         access_token = create_access_token(identity=new_user.id)
@@ -155,18 +180,10 @@ def register():
         set_access_cookies(response, access_token)
         set_refresh_cookies(response, refresh_token)
         
-        # If user had anonymous redesigns, associate them with the new account
-        anonymous_id = request.cookies.get(ANONYMOUS_COOKIE_NAME)
-        if anonymous_id:
-            anonymous_redesigns = Redesign.query.filter_by(anonymous_id=anonymous_id).all()
-            for redesign in anonymous_redesigns:
-                redesign.user_id = new_user.id
-                redesign.anonymous_id = None
-            db.session.commit()
-        
         return response, 201
     
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error in register: {str(e)}")
         return jsonify({'error': 'Registration failed', 'details': str(e)}), 500
 
@@ -192,9 +209,14 @@ def login():
         if not user or not user.verify_password(password):
             return jsonify({'error': 'Invalid email or password'}), 401
         
-        # Update last login time
+        # Update last login time and claim any anonymous redesigns in one transaction
         user.last_login = datetime.datetime.utcnow()
+        anonymous_id = request.cookies.get(ANONYMOUS_COOKIE_NAME)
+        moved = transfer_anonymous_redesigns(anonymous_id, user.id)
         db.session.commit()
+        if moved:
+            usage_counters.forget(anonymous_id=anonymous_id)
+            usage_counters.forget(user_id=user.id)
         
         # Create tokens
         access_token = create_access_token(identity=user.id)
@@ -211,18 +233,10 @@ def login():
         set_access_cookies(response, access_token)
         set_refresh_cookies(response, refresh_token)
         
-        # If user had anonymous redesigns, associate them with the account
-        anonymous_id = request.cookies.get(ANONYMOUS_COOKIE_NAME)
-        if anonymous_id:
-            anonymous_redesigns = Redesign.query.filter_by(anonymous_id=anonymous_id).all()
-            for redesign in anonymous_redesigns:
-                redesign.user_id = user.id
-                redesign.anonymous_id = None
-            db.session.commit()
-        
         return response, 200
     
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error in login: {str(e)}")
         return jsonify({'error': 'Login failed', 'details': str(e)}), 500
 
@@ -256,7 +270,7 @@ def get_user():
         return jsonify({'error': 'User not found'}), 404
     
     # Get usage count
-    usage_count = Redesign.query.filter_by(user_id=current_user_id).count()
+    usage_count = usage_counters.get(user_id=current_user_id)
     
     return jsonify({
         'user': {
@@ -287,7 +301,7 @@ def check_anonymous():
         return response, 200
     
     # Get usage count
-    usage_count = Redesign.query.filter_by(anonymous_id=anonymous_id).count()
+    usage_count = usage_counters.get(anonymous_id=anonymous_id)
     
     return jsonify({
         'anonymous_id': anonymous_id,
@@ -312,9 +326,16 @@ def track_redesign(user_id=None, anonymous_id=None, original_path=None, inspirat
         )
         
         db.session.add(redesign)
+        
+        # Count it in the same transaction, so quota checks never see one without the other
+        if user_id or anonymous_id:
+            usage_counters.increment(user_id=user_id, anonymous_id=anonymous_id)
         db.session.commit()
+        if user_id or anonymous_id:
+            usage_counters.forget(user_id=user_id, anonymous_id=anonymous_id)
         
         return True, redesign.id
     except Exception as e:
         logger.error(f"Error tracking redesign: {str(e)}")
+        db.session.rollback()
         return False, None 
\ No newline at end of file
@@ -0,0 +1,117 @@
+import json
+import logging
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import metrics
+
+# Create a logger
+logger = logging.getLogger(__name__)
+
+CLAUDE_API_URL = "https://api.anthropic.com/v1/messages"
+ANTHROPIC_VERSION = "2023-06-01"
+
+# Claude returns 529 when it is overloaded
+OVERLOADED_STATUS = 529
+
+
+class ClaudeClient:
+    """Shared client for the Claude Messages API over a pooled keep-alive session"""
+
+    def __init__(self, api_key, model, pool_size=10, connect_timeout=5, read_timeout=90,
+                 max_retries=3, initial_delay=1):
+        self.api_key = api_key
+        self.model = model
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.initial_delay = initial_delay
+        self._session = None
+
+    @property
+    def session(self):
+        # Built lazily so each forked worker opens its own connections
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount('https://', adapter)
+            session.headers.update({
+                "x-api-key": self.api_key or "",
+                "anthropic-version": ANTHROPIC_VERSION,
+                "content-type": "application/json"
+            })
+            self._session = session
+        return self._session
+
+    def reset(self):
+        """Forget pooled connections, e.g. ones inherited across a fork"""
+        self._session = None
+
+    def create_message(self, payload, read_timeout=None, stream=False):
+        """POST a Messages API payload, retrying overloads and connection errors with backoff.
+
+        Returns the final requests.Response whatever its status, so callers can
+        map 401/429/etc. to their own errors. Timeouts are raised immediately.
+        """
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        # CLAUDE_MAX_RETRIES=0 still means one attempt
+        attempts = max(1, self.max_retries)
+        last_error = None
+
+        for attempt in range(attempts):
+            start = time.monotonic()
+            try:
+                response = self.session.post(CLAUDE_API_URL, json=payload, timeout=timeout, stream=stream)
+            except requests.exceptions.ConnectionError as e:
+                metrics.incr('claude.connection_errors')
+                last_error = e
+                if attempt < attempts - 1:
+                    delay = self._backoff(attempt)
+                    logger.warning(f"Error connecting to Claude API: {str(e)}, retrying in {delay:.1f} seconds...")
+                    time.sleep(delay)
+                    continue
+                raise
+            except requests.exceptions.Timeout:
+                metrics.incr('claude.timeouts')
+                raise
+            finally:
+                metrics.observe('claude.request_seconds', time.monotonic() - start)
+
+            metrics.incr(f'claude.status.{response.status_code}')
+            logger.info(f"Claude API responded {response.status_code} in {time.monotonic() - start:.2f}s")
+
+            # If overloaded, wait and retry
+            if response.status_code == OVERLOADED_STATUS and attempt < attempts - 1:
+                delay = self._backoff(attempt)
+                logger.warning(f"Claude API overloaded, retrying in {delay:.1f} seconds...")
+                metrics.incr('claude.retries')
+                response.close()
+                time.sleep(delay)
+                continue
+
+            return response
+
+        # The last attempt always returns or raises, but never hand callers None
+        raise last_error or RuntimeError("Claude API request was not attempted")
+
+    def _backoff(self, attempt):
+        # Exponential backoff with jitter
+        return self.initial_delay * (2 ** attempt) + random.uniform(0, 0.1)
+
+
+def iter_stream_events(response):
+    """Yield the JSON payload of each event in a streaming Messages API response"""
+    # SSE is always UTF-8, but requests assumes ISO-8859-1 for text/* without a charset
+    response.encoding = 'utf-8'
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        try:
+            yield json.loads(data)
+        except ValueError:
+            logger.warning(f"Skipping malformed Claude stream event: {data[:100]}")
@@ -2,6 +2,8 @@ import os
 from datetime import timedelta
 import logging
 
+from db_pool import engine_options
+
 # Set up logger
 logger = logging.getLogger(__name__)
 
@@ -17,15 +19,104 @@ class Config:
     JWT_CSRF_CHECK_FORM = True
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload
+    # Browser previews of uploads the browser can't display itself (HEIC)
+    PREVIEW_MAX_EDGE = int(os.environ.get('PREVIEW_MAX_EDGE', 1024))
+    PREVIEW_QUALITY = int(os.environ.get('PREVIEW_QUALITY', 80))
+    # Uploads up to this size are buffered in memory instead of a temporary file
+    UPLOAD_SPOOL_BYTES = int(os.environ.get('UPLOAD_SPOOL_BYTES', 16 * 1024 * 1024))
+
+    # Background generation jobs
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 8))
+    JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', 64))
+    JOB_TTL_SECONDS = int(os.environ.get('JOB_TTL_SECONDS', 3600))
+    BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 6))
+    # Longest a job status request may block (?wait= and event streams); 0 answers right away,
+    # for servers where a held request blocks a whole worker
+    JOB_MAX_WAIT_SECONDS = int(os.environ.get('JOB_MAX_WAIT_SECONDS', 30))
+
+    # Gemini Files API keeps uploads for 48 hours
+    GEMINI_FILE_CACHE_SIZE = int(os.environ.get('GEMINI_FILE_CACHE_SIZE', 256))
+    GEMINI_FILE_TTL_SECONDS = int(os.environ.get('GEMINI_FILE_TTL_SECONDS', 47 * 3600))
+
+    # Claude API connection pool and timeouts (seconds)
+    CLAUDE_POOL_SIZE = int(os.environ.get('CLAUDE_POOL_SIZE', 10))
+    CLAUDE_CONNECT_TIMEOUT = float(os.environ.get('CLAUDE_CONNECT_TIMEOUT', 5))
+    CLAUDE_READ_TIMEOUT = float(os.environ.get('CLAUDE_READ_TIMEOUT', 90))
+    CLAUDE_MAX_RETRIES = int(os.environ.get('CLAUDE_MAX_RETRIES', 3))
+
+    # Images are downscaled to each model's effective resolution before sending (pixels / bytes)
+    CLAUDE_MAX_IMAGE_EDGE = int(os.environ.get('CLAUDE_MAX_IMAGE_EDGE', 1568))
+    CLAUDE_MAX_IMAGE_BYTES = int(os.environ.get('CLAUDE_MAX_IMAGE_BYTES', int(4.5 * 1024 * 1024)))
+    GEMINI_MAX_IMAGE_EDGE = int(os.environ.get('GEMINI_MAX_IMAGE_EDGE', 3072))
+    GEMINI_MAX_IMAGE_BYTES = int(os.environ.get('GEMINI_MAX_IMAGE_BYTES', 20 * 1024 * 1024))
+
+    # Cache of Claude suggestions per image pair, model and prompt version
+    SUGGESTION_CACHE_SIZE = int(os.environ.get('SUGGESTION_CACHE_SIZE', 512))
+    SUGGESTION_CACHE_TTL_SECONDS = int(os.environ.get('SUGGESTION_CACHE_TTL_SECONDS', 7 * 86400))
+    SUGGESTION_CACHE_DATABASE = os.environ.get('SUGGESTION_CACHE_DATABASE', 'true').lower() == 'true'
+
+    # Processes for CPU-bound image work (0 runs it inline) and how many tasks may queue for them
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', os.cpu_count() or 1))
+    IMAGE_MAX_PENDING = int(os.environ.get('IMAGE_MAX_PENDING', 0)) or None
+
+    # How long processed uploads stay addressable by image handle
+    UPLOAD_HANDLE_TTL_SECONDS = int(os.environ.get('UPLOAD_HANDLE_TTL_SECONDS', 6 * 3600))
+
+    # How long a worker trusts its cached usage counts (seconds)
+    USAGE_CACHE_TTL_SECONDS = int(os.environ.get('USAGE_CACHE_TTL_SECONDS', 30))
+    USAGE_CACHE_SIZE = int(os.environ.get('USAGE_CACHE_SIZE', 10000))
+
+    # Background cleanup of uploads/ and generated/ (0 disables it) and their size budgets in MB (0 for none)
+    JANITOR_INTERVAL_SECONDS = int(os.environ.get('JANITOR_INTERVAL_SECONDS', 600))
+    GENERATED_MAX_AGE_SECONDS = int(os.environ.get('GENERATED_MAX_AGE_SECONDS', 7 * 86400))
+    GENERATED_MAX_MB = int(os.environ.get('GENERATED_MAX_MB', 1024))
+    UPLOADS_MAX_MB = int(os.environ.get('UPLOADS_MAX_MB', 256))
+
+    # Where uploads and generated images are kept: 'local' disk, or 's3' for any S3-compatible
+    # bucket (AWS, MinIO via STORAGE_ENDPOINT_URL, GCS interoperability); s3 needs boto3
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local').lower()
+    STORAGE_BUCKET = os.environ.get('STORAGE_BUCKET')
+    STORAGE_PREFIX = os.environ.get('STORAGE_PREFIX', '')
+    STORAGE_ENDPOINT_URL = os.environ.get('STORAGE_ENDPOINT_URL')
+    STORAGE_REGION = os.environ.get('STORAGE_REGION')
+    STORAGE_URL_TTL_SECONDS = int(os.environ.get('STORAGE_URL_TTL_SECONDS', 3600))
+    STORAGE_WRITERS = int(os.environ.get('STORAGE_WRITERS', 4))
+
+    # Download links: 'database' works across workers and instances, 'memory' only within one process
+    DOWNLOAD_STORE = os.environ.get('DOWNLOAD_STORE', 'database').lower()
+    DOWNLOAD_TOKEN_TTL_SECONDS = int(os.environ.get('DOWNLOAD_TOKEN_TTL_SECONDS', 3600))
+    DOWNLOAD_TOKEN_MAX_ENTRIES = int(os.environ.get('DOWNLOAD_TOKEN_MAX_ENTRIES', 10000))
+
+    # Database connections. Every server worker on every instance has its own pool, so each gets
+    # an equal share of DB_MAX_CONNECTIONS: keep that under the server's max_connections (100 on
+    # Cloud SQL's smallest tiers) with room for migrations and admin tools, and DB_MAX_INSTANCES
+    # in step with Cloud Run's --max-instances. DB_POOL_SIZE and DB_MAX_OVERFLOW override how a
+    # share is split between kept-open and burst connections, but can't exceed it.
+    DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', 80))
+    DB_MAX_INSTANCES = int(os.environ.get('DB_MAX_INSTANCES', 4))
+    SERVER_WORKERS = int(os.environ.get('GUNICORN_WORKERS', 1))
+    DB_POOL_SIZE = int(os.environ['DB_POOL_SIZE']) if os.environ.get('DB_POOL_SIZE') else None
+    DB_MAX_OVERFLOW = int(os.environ['DB_MAX_OVERFLOW']) if os.environ.get('DB_MAX_OVERFLOW') else None
+    # Seconds to wait for a free connection, to reuse one before replacing it, and to open one
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', 10))
+    # PostgreSQL cancels statements running longer than this (milliseconds, 0 for no limit)
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+
+    # Create missing tables at startup; deployed databases are migrated with `flask db upgrade` instead
+    AUTO_CREATE_TABLES = os.environ.get('AUTO_CREATE_TABLES', 'false').lower() == 'true'
 
     @staticmethod
     def init_app(app):
-        pass
+        # Pool options depend on the database URL, which each environment sets differently
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
 
 
 # Development configuration
 class DevelopmentConfig(Config):
     DEBUG = True
+    AUTO_CREATE_TABLES = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('DEV_DATABASE_URL') or \
         'sqlite:///dev.db'
 
@@ -33,6 +124,8 @@ class DevelopmentConfig(Config):
 # Testing configuration
 class TestingConfig(Config):
     TESTING = True
+    IMAGE_WORKERS = 0
+    AUTO_CREATE_TABLES = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite:///:memory:'
 
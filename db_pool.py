@@ -0,0 +1,113 @@
+import logging
+import time
+
+from flask import has_app_context
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from metrics import metrics
+from models import db
+
+# Create a logger
+logger = logging.getLogger(__name__)
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            metrics.incr('db.pool_timeouts')
+            raise
+        finally:
+            metrics.observe('db.pool_wait', time.perf_counter() - started)
+
+
+def connection_budget(app_config):
+    """(pool_size, max_overflow) for one server worker's share of DB_MAX_CONNECTIONS"""
+    share = max(1, app_config['DB_MAX_CONNECTIONS'] // max(1, app_config['DB_MAX_INSTANCES'])
+                // max(1, app_config['SERVER_WORKERS']))
+    # By default half the share stays open; overflow connections close again when returned
+    pool_size = app_config['DB_POOL_SIZE']
+    if pool_size is None:
+        pool_size = max(1, (share + 1) // 2)
+    max_overflow = app_config['DB_MAX_OVERFLOW']
+    if max_overflow is None:
+        max_overflow = share - min(pool_size, share)
+
+    if pool_size + max_overflow > share:
+        logger.warning(f"DB_POOL_SIZE {pool_size} + DB_MAX_OVERFLOW {max_overflow} is over this worker's share "
+                       f"of DB_MAX_CONNECTIONS ({share}), capping it")
+        pool_size = min(pool_size, share)
+        max_overflow = min(max_overflow, share - pool_size)
+    return pool_size, max_overflow
+
+
+def engine_options(app_config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database URL.
+
+    SQLite keeps Flask-SQLAlchemy's defaults: in-memory databases need its
+    StaticPool, and local files have no server to pool connections to.
+    """
+    uri = app_config.get('SQLALCHEMY_DATABASE_URI') or ''
+    if uri.startswith('sqlite'):
+        return {}
+
+    pool_size, max_overflow = connection_budget(app_config)
+    options = {
+        'poolclass': MeteredQueuePool,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': app_config['DB_POOL_TIMEOUT'],
+        # Test connections before use so ones dropped while idle are replaced, not handed to a request
+        'pool_pre_ping': True,
+        'pool_recycle': app_config['DB_POOL_RECYCLE'],
+        # Reuse the most recent connection so extra ones sit idle long enough to be recycled
+        'pool_use_lifo': True
+    }
+    if uri.startswith('postgres'):
+        connect_args = {'connect_timeout': app_config['DB_CONNECT_TIMEOUT']}
+        if app_config['DB_STATEMENT_TIMEOUT_MS']:
+            connect_args['options'] = f"-c statement_timeout={app_config['DB_STATEMENT_TIMEOUT_MS']}"
+        options['connect_args'] = connect_args
+    return options
+
+
+def release_connection():
+    """Give the request's database connection back to the pool before a slow external call.
+
+    The session holds a connection from its first query until the request
+    ends, so a request waiting on Claude would keep one idle all that time.
+    Sessions with unsaved changes are left alone.
+    """
+    if not has_app_context():
+        return
+    session = db.session()
+    if not session.in_transaction() or session.new or session.dirty or session.deleted:
+        return
+    session.commit()
+
+
+def watch_engine(engine):
+    """Count connections opened, checked out and invalidated on engine's pool.
+
+    Listeners stay on the engine, so they survive dispose() after a fork.
+    """
+    event.listen(engine, 'connect', lambda dbapi_connection, record: metrics.incr('db.connections_opened'))
+    event.listen(engine, 'checkout', lambda dbapi_connection, record, proxy: metrics.incr('db.checkouts'))
+    event.listen(engine, 'invalidate',
+                 lambda dbapi_connection, record, exception: metrics.incr('db.connections_invalidated'))
+
+
+def pool_stats(engine):
+    """Current state of engine's pool; pools other than QueuePool report only their class"""
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(size=pool.size(), checked_out=pool.checkedout(), checked_in=pool.checkedin(),
+                     overflow=max(0, pool.overflow()))
+    return stats
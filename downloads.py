@@ -0,0 +1,172 @@
+import datetime
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+
+from models import db, DownloadToken
+from metrics import metrics
+
+# Create a logger
+logger = logging.getLogger(__name__)
+
+# What a download link points at
+DownloadInfo = namedtuple('DownloadInfo', ['file_path', 'filename', 'expires_at'])
+
+# How often the background sweeper drops expired tokens
+SWEEP_INTERVAL_SECONDS = 60
+
+
+class DownloadStore:
+    """Expiring download tokens with a background sweep. Subclasses hold the tokens."""
+
+    backend = None
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._sweeper = None
+        self._sweeper_lock = threading.Lock()
+
+    def create(self, file_path, filename):
+        """Store a token for file_path and return it"""
+        token = str(uuid.uuid4())
+        self._put(token, DownloadInfo(file_path, filename, time.time() + self.ttl))
+        metrics.incr('downloads.tokens_created')
+        self._ensure_sweeper()
+        return token
+
+    def get(self, token):
+        """Return the DownloadInfo for token, or None if it is unknown or expired"""
+        info = self._get(token)
+        if info and info.expires_at <= time.time():
+            info = None
+        if info is None:
+            metrics.incr('downloads.tokens_missing')
+        return info
+
+    def sweep(self):
+        """Drop expired tokens and return how many were removed"""
+        raise NotImplementedError
+
+    def stats(self):
+        return {'backend': self.backend, 'ttl': self.ttl}
+
+    def _put(self, token, info):
+        raise NotImplementedError
+
+    def _get(self, token):
+        raise NotImplementedError
+
+    def _ensure_sweeper(self):
+        # Started on first use so each forked server worker runs its own
+        if self._sweeper and self._sweeper.is_alive():
+            return
+        with self._sweeper_lock:
+            if self._sweeper and self._sweeper.is_alive():
+                return
+            self._sweeper = threading.Thread(target=self._sweep_forever, name='download-sweeper', daemon=True)
+            self._sweeper.start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(SWEEP_INTERVAL_SECONDS)
+            try:
+                removed = self.sweep()
+                if removed:
+                    logger.info(f"Removed {removed} expired download tokens")
+            except Exception as e:
+                logger.error(f"Error sweeping download tokens: {str(e)}")
+
+
+class MemoryDownloadStore(DownloadStore):
+    """Tokens in a bounded in-process dict; links only work on the worker that made them"""
+
+    backend = 'memory'
+
+    def __init__(self, ttl=3600, max_entries=10000):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def sweep(self):
+        # Every token gets the same TTL, so insertion order is expiry order
+        now = time.time()
+        removed = 0
+        with self._lock:
+            while self._entries:
+                token, info = next(iter(self._entries.items()))
+                if info.expires_at > now:
+                    break
+                del self._entries[token]
+                removed += 1
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return dict(super().stats(), entries=len(self._entries), max_entries=self.max_entries)
+
+    def _put(self, token, info):
+        with self._lock:
+            self._entries[token] = info
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get(self, token):
+        with self._lock:
+            return self._entries.get(token)
+
+
+class DatabaseDownloadStore(DownloadStore):
+    """Tokens in the download_tokens table, shared by every worker and instance"""
+
+    backend = 'database'
+
+    def __init__(self, app, ttl=3600):
+        super().__init__(ttl)
+        # The sweeper thread needs its own app context
+        self.app = app
+
+    def sweep(self):
+        with self.app.app_context():
+            try:
+                removed = DownloadToken.query.filter(
+                    DownloadToken.expires_at <= datetime.datetime.utcnow()
+                ).delete(synchronize_session=False)
+                db.session.commit()
+                return removed
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def _put(self, token, info):
+        try:
+            db.session.add(DownloadToken(
+                token=token,
+                file_path=info.file_path,
+                filename=info.filename,
+                expires_at=datetime.datetime.utcfromtimestamp(info.expires_at)
+            ))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _get(self, token):
+        entry = db.session.get(DownloadToken, token)
+        if not entry:
+            return None
+        expires_at = entry.expires_at.replace(tzinfo=datetime.timezone.utc).timestamp()
+        return DownloadInfo(entry.file_path, entry.filename, expires_at)
+
+
+def create_download_store(app):
+    """Build the store named by the DOWNLOAD_STORE setting ('database' or 'memory')"""
+    ttl = app.config['DOWNLOAD_TOKEN_TTL_SECONDS']
+    backend = app.config['DOWNLOAD_STORE']
+    if backend == 'memory':
+        return MemoryDownloadStore(ttl=ttl, max_entries=app.config['DOWNLOAD_TOKEN_MAX_ENTRIES'])
+    if backend != 'database':
+        logger.warning(f"Unknown DOWNLOAD_STORE {backend}, using the database")
+    return DatabaseDownloadStore(app, ttl=ttl)
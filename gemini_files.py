@@ -0,0 +1,117 @@
+import datetime
+import hashlib
+import io
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Create a logger
+logger = logging.getLogger(__name__)
+
+# What we remember about a file that already lives in the Gemini Files API
+CachedFile = namedtuple('CachedFile', ['uri', 'mime_type', 'expires_at'])
+
+# Re-upload this long before Gemini says the file expires
+EXPIRY_MARGIN_SECONDS = 15 * 60
+
+
+def file_sha256(path):
+    """Hash a file's contents without loading it all into memory"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class GeminiFileCache:
+    """Content-addressed cache of Gemini file uploads with TTL and LRU eviction"""
+
+    def __init__(self, max_entries=256, ttl=47 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def get_or_upload(self, client, path, limits=None):
+        """Return a CachedFile for path, uploading only if we don't hold a live URI for its contents.
+
+        With limits (an image_pipeline.ModelImageLimits), the image is downscaled
+        to the model's resolution before upload.
+        """
+        key = self._key(path, limits)
+
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and entry.expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+                if entry:
+                    # Gemini has dropped (or is about to drop) the file
+                    logger.info(f"Gemini file for {key[:12]} expired, re-uploading")
+                    del self._entries[key]
+
+                # Let only one thread upload a given image at a time
+                inflight = self._inflight.get(key)
+                if inflight is None:
+                    inflight = threading.Event()
+                    self._inflight[key] = inflight
+                    self.misses += 1
+                    break
+
+            # Another thread is uploading the same bytes; reuse its result
+            inflight.wait()
+
+        try:
+            if limits:
+                from image_pipeline import prepare_for_model
+                # Uploads already run on a bounded job pool, so wait for an image worker
+                data, mime_type = prepare_for_model(path, limits, block=True)
+                uploaded_file = client.files.upload(file=io.BytesIO(data), config={'mime_type': mime_type})
+            else:
+                uploaded_file = client.files.upload(file=path)
+            entry = CachedFile(
+                uri=uploaded_file.uri,
+                mime_type=uploaded_file.mime_type,
+                expires_at=self._expiry_for(uploaded_file)
+            )
+            with self._lock:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            logger.info(f"Uploaded {path} to Gemini as {entry.uri}")
+            return entry
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            inflight.set()
+
+    def invalidate(self, path, limits=None):
+        with self._lock:
+            self._entries.pop(self._key(path, limits), None)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+    def _key(self, path, limits):
+        key = file_sha256(path)
+        if limits:
+            # The same source uploaded at different limits is a different file
+            key = f"{key}:{limits.max_edge}:{limits.max_bytes}"
+        return key
+
+    def _expiry_for(self, uploaded_file):
+        expires_at = time.time() + self.ttl
+        expiration_time = getattr(uploaded_file, 'expiration_time', None)
+        if isinstance(expiration_time, datetime.datetime):
+            if expiration_time.tzinfo is None:
+                expiration_time = expiration_time.replace(tzinfo=datetime.timezone.utc)
+            expires_at = min(expires_at, expiration_time.timestamp())
+        return expires_at - EXPIRY_MARGIN_SECONDS
@@ -0,0 +1,92 @@
+import multiprocessing
+import os
+
+# Requests mostly wait on Claude and Gemini, and image work runs in its own
+# process pool (see image_workers.py), so one worker process with many
+# threads uses the instance's cores without more workers.
+
+# Memory budgeted per worker process (app, caches) and per in-flight request (uploads, payloads)
+WORKER_MEMORY_MB = int(os.environ.get('GUNICORN_WORKER_MEMORY_MB', 512))
+THREAD_MEMORY_MB = int(os.environ.get('GUNICORN_THREAD_MEMORY_MB', 48))
+
+
+def _available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return multiprocessing.cpu_count()
+
+
+def _available_memory_mb():
+    # Container limit first (cgroup v2, then v1), then physical memory
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value.isdigit() and int(value) < 1 << 60:
+                return int(value) // (1024 * 1024)
+        except OSError:
+            pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+    except (ValueError, OSError):
+        return 2048
+
+
+cpus = _available_cpus()
+memory_mb = _available_memory_mb()
+
+# Job status is held in process memory (see jobs.py), so job polls and event
+# streams must reach the worker that ran the job. Until jobs move to a shared
+# store each instance runs exactly one worker; scale with threads and instances.
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+if workers != 1:
+    raise RuntimeError("GUNICORN_WORKERS must be 1 while job state is kept in process memory")
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS') or
+              max(4, min(64, (memory_mb // workers - WORKER_MEMORY_MB) // THREAD_MEMORY_MB)))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+
+# Route classes and their time limits:
+# - AI routes (suggestions, synchronous generation) wait up to CLAUDE_READ_TIMEOUT (90s)
+#   for Claude, plus image encoding; SSE streams send data throughout.
+# - Everything else (static files, handles, job polls capped at 30s) returns quickly.
+# With gthread the worker heartbeat runs on its own thread, so `timeout` only
+# kills a worker that is truly hung; it must still outlast the slowest AI route.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+# Cloud Run sends SIGKILL about 10s after SIGTERM, so shutdown has to finish inside that:
+# quick requests complete, but in-flight AI calls are cut off and clients retry them.
+# Raise this on hosts that give a longer grace period.
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 8))
+keepalive = 5
+
+# Import app.py and run create_app() once before forking (the Gemini SDK loads on first use)
+preload_app = True
+
+# Heartbeat files on tmpfs so a slow container disk can't stall workers
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+# Size the per-worker pools to match, unless configured explicitly
+os.environ.setdefault('IMAGE_WORKERS', str(max(1, cpus // workers)))
+os.environ.setdefault('CLAUDE_POOL_SIZE', str(threads))
+os.environ.setdefault('JOB_WORKERS', str(max(4, threads // 2)))
+# A sync worker serves one request at a time, so job polls mustn't hold it
+if worker_class == 'sync':
+    os.environ.setdefault('JOB_MAX_WAIT_SECONDS', '0')
+
+
+def when_ready(server):
+    server.log.info(f"Serving with {workers} {worker_class} workers x {threads} threads "
+                    f"({cpus} CPUs, {memory_mb} MB)")
+
+
+def post_fork(server, worker):
+    # The preloaded app was built in the master; drop connections and pools it inherited
+    from app import reset_after_fork
+    reset_after_fork()
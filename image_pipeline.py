@@ -0,0 +1,454 @@
+import io
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+
+from PIL import Image
+
+from metrics import metrics
+from image_workers import image_workers
+
+# Create a logger
+logger = logging.getLogger(__name__)
+
+# Decode HEIC/HEIF in-process when pillow-heif is installed
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIF_NATIVE = True
+except ImportError:
+    HEIF_NATIVE = False
+
+# External HEIC converters, in order of preference: (executable, args given source and destination)
+HEIC_CONVERTERS = [
+    ('sips', lambda src, dest: ['-s', 'format', 'jpeg', '-s', 'formatOptions', 'best', src, '--out', dest]),
+    ('heif-convert', lambda src, dest: [src, dest]),
+    ('convert', lambda src, dest: [src, dest]),
+]
+
+# Background used when flattening transparent images for JPEG
+FLATTEN_BACKGROUND = (255, 255, 255)
+
+# Keep decoded images for recently used paths, bounded by total pixels (~3 x 12MP photos)
+MAX_CACHED_PIXELS = 36 * 1000 * 1000
+
+# Keep model-ready encodings of recently used images, bounded by total bytes
+MAX_PREPARED_BYTES = 64 * 1024 * 1024
+
+# What Pillow raises for files it can't decode (UnidentifiedImageError and truncated files are OSErrors)
+DECODE_ERRORS = (OSError, SyntaxError, ValueError, Image.DecompressionBombError)
+
+# Formats both Claude and Gemini accept as-is
+SENDABLE_FORMATS = ('JPEG', 'PNG', 'WEBP')
+
+# Largest image a provider accepts and the long edge past which it downsamples anyway
+ModelImageLimits = namedtuple('ModelImageLimits', ['provider', 'max_edge', 'max_bytes'])
+
+# Side of the centre crop used to estimate full-image JPEG size per quality
+SAMPLE_EDGE = 512
+
+# Aim the estimate this far under the budget so the full encode usually fits first time
+ESTIMATE_HEADROOM = 0.9
+
+
+def flatten_to_rgb(img):
+    """Convert any PIL image to RGB, compositing transparency onto white"""
+    if img.mode == 'P' and 'transparency' in img.info:
+        img = img.convert('RGBA')
+    if img.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB', img.size, FLATTEN_BACKGROUND)
+        background.paste(img, mask=img.split()[-1])
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+_available_converters = None
+
+
+def available_heic_converters():
+    """Executables from HEIC_CONVERTERS found on PATH, probed once per process"""
+    global _available_converters
+    if _available_converters is None:
+        found = []
+        for name, args in HEIC_CONVERTERS:
+            # sips is macOS-only; elsewhere a binary of that name is something else
+            if name == 'sips' and sys.platform != 'darwin':
+                continue
+            executable = shutil.which(name)
+            if executable:
+                found.append((name, executable, args))
+        _available_converters = found
+        logger.info(f"HEIC decoding: native={HEIF_NATIVE}, converters={[name for name, _, _ in found] or 'none'}")
+    return _available_converters
+
+
+def convert_heic(src, dest):
+    """Convert a HEIC file to JPEG with the first available external tool. Returns True on success."""
+    for name, executable, args in available_heic_converters():
+        try:
+            subprocess.run([executable] + args(src, dest), check=True, capture_output=True, timeout=60)
+            if os.path.exists(dest):
+                logger.info(f"HEIC conversion with {name} succeeded")
+                return True
+        except Exception as e:
+            logger.warning(f"{name} conversion failed: {str(e)}")
+    return False
+
+
+class NormalizedImage:
+    """An image decoded once and flattened to RGB, with derived renditions cached"""
+
+    def __init__(self, image, full_resolution=True):
+        self.image = image
+        self.full_resolution = full_resolution
+        self._resized = {}
+        self._encoded = {}
+        self._saved = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, source, draft_edge=None):
+        """Decode a path or file-like object.
+
+        With draft_edge, JPEGs are decoded at the smallest DCT scale whose long
+        edge is still at least draft_edge, which is far cheaper than a full decode.
+        """
+        img = Image.open(source)
+        full_resolution = True
+        if draft_edge and img.format == 'JPEG' and max(img.size) > draft_edge:
+            scale = draft_edge / max(img.size)
+            img.draft('RGB', (max(1, int(img.width * scale)), max(1, int(img.height * scale))))
+            full_resolution = False
+        # load() also releases the file handle for single-frame images opened by path
+        img.load()
+        return cls(flatten_to_rgb(img), full_resolution=full_resolution)
+
+    @property
+    def size(self):
+        return self.image.size
+
+    @property
+    def pixels(self):
+        return self.image.width * self.image.height
+
+    def resized(self, max_edge=None):
+        """Rendition whose long edge is at most max_edge (the normalized image itself if already smaller)"""
+        if not max_edge or max(self.image.size) <= max_edge:
+            return self.image
+        with self._lock:
+            rendition = self._resized.get(max_edge)
+            if rendition is None:
+                rendition = self.image.copy()
+                rendition.thumbnail((max_edge, max_edge), Image.LANCZOS)
+                self._resized[max_edge] = rendition
+            return rendition
+
+    def encode(self, format='JPEG', quality=95, max_edge=None, **options):
+        """Encoded bytes of a rendition, cached per format/quality/size"""
+        key = (format, quality, max_edge, tuple(sorted(options.items())))
+        with self._lock:
+            data = self._encoded.get(key)
+        if data is None:
+            buffer = io.BytesIO()
+            self.resized(max_edge).save(buffer, format=format, quality=quality, **options)
+            data = buffer.getvalue()
+            with self._lock:
+                self._encoded[key] = data
+        return data
+
+    def save(self, path, format='JPEG', quality=95, max_edge=None, **options):
+        data = self.encode(format=format, quality=quality, max_edge=max_edge, **options)
+        # Write then rename, so a concurrent reader never sees a partial file
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        size = self.resized(max_edge).size
+        with self._lock:
+            self._saved[os.path.abspath(path)] = (data, size, format)
+
+    def saved(self, path):
+        """(bytes, size, format) this image wrote to path, or None, so callers needn't read it back"""
+        with self._lock:
+            return self._saved.get(os.path.abspath(path))
+
+
+def _jpeg_size(img, quality):
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality)
+    return buffer.tell()
+
+
+def _centre_sample(img):
+    """Centre crop of at most SAMPLE_EDGE square, and the full/sample pixel ratio"""
+    width = min(img.width, SAMPLE_EDGE)
+    height = min(img.height, SAMPLE_EDGE)
+    left = (img.width - width) // 2
+    top = (img.height - height) // 2
+    sample = img.crop((left, top, left + width, top + height))
+    return sample, (img.width * img.height) / (width * height)
+
+
+def _search_quality(fits, low, high):
+    """Highest quality in [low, high] for which fits(quality) is true, or None"""
+    best = None
+    while low <= high:
+        mid = (low + high) // 2
+        if fits(mid):
+            best = mid
+            low = mid + 1
+        else:
+            high = mid - 1
+    return best
+
+
+def encode_to_budget(normalized, max_bytes, max_edge, min_quality=30, max_quality=90, min_edge=512):
+    """Encode a JPEG of at most max_bytes at the highest quality that fits.
+
+    The long edge is capped at max_edge up front. Quality is binary-searched on
+    a centre sample to estimate the full-image size, then confirmed (and if
+    needed narrowed) with full encodes. If even min_quality is too big, the
+    edge is shrunk in proportion to the overshoot and the search repeated.
+
+    Returns (data, quality, edge), or (None, None, None) if nothing fits.
+    """
+    edge = min(max_edge, max(normalized.size))
+    while True:
+        working = normalized.resized(edge)
+
+        # Estimate: sample bytes scaled by area, with headroom for the sample being unrepresentative
+        sample, ratio = _centre_sample(working)
+        estimate = _search_quality(
+            lambda q: _jpeg_size(sample, q) * ratio <= max_bytes * ESTIMATE_HEADROOM,
+            min_quality, max_quality
+        ) or min_quality
+
+        # Confirm with a full encode, then search below the estimate only if it overshot
+        data = normalized.encode(quality=estimate, max_edge=edge)
+        if len(data) <= max_bytes:
+            return data, estimate, edge
+
+        quality = _search_quality(
+            lambda q: _jpeg_size(working, q) <= max_bytes, min_quality, estimate - 1
+        )
+        if quality is not None:
+            return normalized.encode(quality=quality, max_edge=edge), quality, edge
+
+        if edge <= min_edge:
+            return None, None, None
+
+        # Bytes scale roughly with area, so shrink the edge by the square root of the overshoot
+        smallest = _jpeg_size(working, min_quality)
+        edge = max(min_edge, int(edge * (max_bytes / smallest) ** 0.5 * ESTIMATE_HEADROOM))
+
+
+def _sendable(file_size, size, image_format, limits):
+    """True if an image can go to the model untouched"""
+    return file_size <= limits.max_bytes and max(size) <= limits.max_edge and image_format in SENDABLE_FORMATS
+
+
+def prepare_for_model(path, limits, max_quality=90, block=False):
+    """Bytes and media type to send a model for the image at path.
+
+    The original file is sent untouched when it is already within the
+    provider's limits; otherwise it is downscaled to limits.max_edge and
+    encoded to fit limits.max_bytes on the image worker pool.
+    """
+    # Uploads prepared while they were processed, and images already sent once
+    prepared = prepared_images.get(path, limits)
+    if prepared:
+        data, media_type = prepared
+        file_size = os.path.getsize(path)
+        metrics.incr(f'images.{limits.provider}.prepared_hits')
+        metrics.incr(f'images.{limits.provider}.bytes_original', file_size)
+        metrics.incr(f'images.{limits.provider}.bytes_sent', len(data))
+        metrics.incr(f'images.{limits.provider}.bytes_saved', max(0, file_size - len(data)))
+        return data, media_type
+
+    # Uploads we just processed inline are still in memory, so don't read them back from disk
+    normalized = normalized_images.peek(path)
+    saved = normalized.saved(path) if normalized else None
+    if saved:
+        data, size, image_format = saved
+        file_size = len(data)
+        media_type = Image.MIME.get(image_format, 'image/jpeg')
+    else:
+        data = None
+        file_size = os.path.getsize(path)
+        # Opening only reads the header, so this is cheap even for large photos
+        with Image.open(path) as img:
+            size, image_format, media_type = img.size, img.format, img.get_format_mimetype()
+
+    if _sendable(file_size, size, image_format, limits):
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+    else:
+        data, quality, edge = image_workers.run(encode_for_model, path, limits, max_quality, block=block)
+        media_type = 'image/jpeg'
+        metrics.incr(f'images.{limits.provider}.downscaled')
+        logger.info(f"Prepared {path} for {limits.provider}: {size[0]}x{size[1]} {file_size / (1024 * 1024):.2f} MB -> "
+                    f"{edge}px q{quality} {len(data) / (1024 * 1024):.2f} MB")
+
+    prepared_images.remember(path, limits, (data, media_type))
+    metrics.incr(f'images.{limits.provider}.bytes_original', file_size)
+    metrics.incr(f'images.{limits.provider}.bytes_sent', len(data))
+    metrics.incr(f'images.{limits.provider}.bytes_saved', max(0, file_size - len(data)))
+    return data, media_type
+
+
+def store_upload(source, output_path, limits=None, preview=None, quality=95):
+    """Run normalize_upload on the image worker pool and keep its model rendition for prepare_for_model.
+
+    A worker process can't fill this process's caches, so everything later
+    steps need is derived in that one call and its bytes sent back.
+    Returns the normalized image's size.
+    """
+    size, prepared = image_workers.run(normalize_upload, source, output_path, quality, limits, preview)
+    if prepared:
+        prepared_images.remember(output_path, limits, prepared)
+    return size
+
+
+class NormalizedImageCache:
+    """Recently decoded images keyed by path and modification time"""
+
+    def __init__(self, max_pixels=MAX_CACHED_PIXELS):
+        self.max_pixels = max_pixels
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, path, draft_edge=None):
+        """Return a NormalizedImage for path, decoding only if no suitable one is cached"""
+        key = self._key(path)
+        with self._lock:
+            normalized = self._entries.get(key)
+            if normalized and (normalized.full_resolution or (draft_edge and max(normalized.size) >= draft_edge)):
+                self._entries.move_to_end(key)
+                return normalized
+
+        normalized = NormalizedImage.open(path, draft_edge=draft_edge)
+        self.remember(path, normalized)
+        return normalized
+
+    def peek(self, path):
+        """The cached NormalizedImage for path, without decoding on a miss"""
+        key = self._key(path)
+        with self._lock:
+            return self._entries.get(key)
+
+    def remember(self, path, normalized):
+        """Keep an already decoded image for later steps that read the same file"""
+        key = self._key(path)
+        with self._lock:
+            self._entries[key] = normalized
+            self._entries.move_to_end(key)
+            total = sum(entry.pixels for entry in self._entries.values())
+            while total > self.max_pixels and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                total -= evicted.pixels
+
+    def _key(self, path):
+        path = os.path.abspath(path)
+        return (path, os.path.getmtime(path))
+
+
+class PreparedImageCache:
+    """Bytes and media type prepared for a model, keyed by path, modification time and limits"""
+
+    def __init__(self, max_bytes=MAX_PREPARED_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, path, limits):
+        key = self._key(path, limits)
+        with self._lock:
+            prepared = self._entries.get(key)
+            if prepared:
+                self._entries.move_to_end(key)
+            return prepared
+
+    def remember(self, path, limits, prepared):
+        key = self._key(path, limits)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous:
+                self._bytes -= len(previous[0])
+            self._entries[key] = prepared
+            self._bytes += len(prepared[0])
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (data, _) = self._entries.popitem(last=False)
+                self._bytes -= len(data)
+
+    def _key(self, path, limits):
+        path = os.path.abspath(path)
+        return (path, os.path.getmtime(path), limits)
+
+
+# Shared caches for the whole process
+normalized_images = NormalizedImageCache()
+prepared_images = PreparedImageCache()
+
+
+# Worker tasks. These run on the image worker pool, so they are top-level functions
+# taking and returning only picklable values (paths, bytes, tuples).
+
+def normalize_upload(source, output_path, quality=95, limits=None, preview=None):
+    """Decode an upload (bytes, file object or path), flatten it and save it as JPEG.
+
+    Renditions of the upload are made from the same decode: with limits, the
+    bytes to send that model, and with preview=(path, max_edge, quality), a
+    browser preview. Returns (size, (data, media type) for limits or None).
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    normalized = NormalizedImage.open(source)
+    normalized.save(output_path, format='JPEG', quality=quality)
+    # Later steps in this process on the same upload reuse the decoded image and its bytes
+    normalized_images.remember(output_path, normalized)
+
+    prepared = None
+    if limits:
+        data, size, image_format = normalized.saved(output_path)
+        if _sendable(len(data), size, image_format, limits):
+            prepared = (data, Image.MIME.get(image_format, 'image/jpeg'))
+        else:
+            # An image that can't fit is left for prepare_for_model to report
+            data, _, _ = encode_to_budget(normalized, limits.max_bytes, limits.max_edge)
+            prepared = (data, 'image/jpeg') if data else None
+    if preview:
+        _save_preview(normalized, *preview)
+    return normalized.size, prepared
+
+
+def _save_preview(normalized, preview_path, max_edge, quality):
+    normalized.save(preview_path, format='JPEG', quality=quality, max_edge=max_edge,
+                    progressive=True, optimize=True)
+
+
+def write_preview(image_path, preview_path, max_edge, quality):
+    """Write a small progressive JPEG of an image for the browser to display"""
+    # Reuses the decoded upload if cached, otherwise draft-decodes near the preview size
+    _save_preview(normalized_images.load(image_path, draft_edge=max_edge), preview_path, max_edge, quality)
+
+
+def encode_for_model(path, limits, max_quality=90):
+    """Downscale and encode an image to fit a model's limits. Returns (data, quality, edge)."""
+    normalized = normalized_images.load(path, draft_edge=limits.max_edge)
+    data, quality, edge = encode_to_budget(normalized, limits.max_bytes, limits.max_edge, max_quality=max_quality)
+    if data is None:
+        raise ValueError(f"Could not fit {path} within {limits.provider}'s image limits")
+    return data, quality, edge
+
+
+def write_download(image_path, download_path, quality=95):
+    """Write the full-resolution JPEG of an image that users download, flattened to RGB"""
+    normalized_images.load(image_path).save(download_path, format='JPEG', quality=quality, optimize=True)
@@ -0,0 +1,134 @@
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import metrics
+
+# Create a logger
+logger = logging.getLogger(__name__)
+
+# Tasks allowed to wait in the queue per worker process before we push back
+DEFAULT_QUEUE_PER_WORKER = 4
+
+
+class ImageWorkersBusy(Exception):
+    """Raised when the image worker queue is full"""
+    pass
+
+
+class ImageWorkersUnavailable(ImageWorkersBusy):
+    """Raised when the pool itself failed a task (a worker died, timed out or couldn't exchange data).
+
+    A subclass of ImageWorkersBusy, so callers answer both with a retryable 503.
+    """
+    pass
+
+
+class ImageWorkerPool:
+    """Runs CPU-bound image work in separate processes with a bounded queue.
+
+    Tasks must be picklable top-level functions (see image_pipeline) taking
+    paths or bytes. With max_workers=0 tasks run inline on the calling thread,
+    which is handy for development and tests.
+    """
+
+    def __init__(self, max_workers=None, max_pending=None):
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._pending = 0
+        # Bumped by shutdown(), so callbacks from an old executor's tasks don't touch the new count
+        self._generation = 0
+        self.configure(max_workers, max_pending)
+
+    def configure(self, max_workers=None, max_pending=None):
+        """Set pool size (default: CPU count) and queue depth (default: 4 per worker)"""
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        self.max_workers = max_workers
+        self.max_pending = max_pending or max(1, max_workers) * DEFAULT_QUEUE_PER_WORKER
+
+    def run(self, fn, *args, block=False, timeout=None):
+        """Run fn(*args) in a worker process and return its result.
+
+        When the queue is full this raises ImageWorkersBusy, or with block=True
+        waits for a free slot (for background jobs, which are already bounded).
+        """
+        if not self.max_workers:
+            return fn(*args)
+
+        with self._slot_freed:
+            while self._pending >= self.max_pending:
+                if not block:
+                    metrics.incr('image_workers.rejected')
+                    raise ImageWorkersBusy(f"{self._pending} image tasks already queued")
+                self._slot_freed.wait()
+            self._pending += 1
+            executor = self._get_executor()
+            generation = self._generation
+
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            self._release(generation)
+            raise
+        future.add_done_callback(lambda _: self._release(generation))
+        metrics.incr(f'image_workers.tasks.{fn.__name__}')
+        try:
+            return future.result(timeout=timeout)
+        except BrokenProcessPool as e:
+            # A worker died (e.g. killed for memory); start a fresh pool for the next task
+            logger.error("Image worker pool broke, restarting it")
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            metrics.incr('image_workers.failed')
+            raise ImageWorkersUnavailable("Image worker pool broke") from e
+        except (CancelledError, FuturesTimeoutError, pickle.PickleError) as e:
+            metrics.incr('image_workers.failed')
+            raise ImageWorkersUnavailable(f"Image task {fn.__name__} failed in the pool: {str(e)}") from e
+
+    @property
+    def inline(self):
+        """True when tasks run on the calling thread rather than in worker processes"""
+        return not self.max_workers
+
+    def stats(self):
+        with self._lock:
+            return {'pending': self._pending, 'max_pending': self.max_pending, 'max_workers': self.max_workers}
+
+    def shutdown(self):
+        """Stop the worker processes, e.g. in a freshly forked server worker"""
+        with self._slot_freed:
+            executor, self._executor = self._executor, None
+            self._pending = 0
+            self._generation += 1
+            self._slot_freed.notify_all()
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, generation):
+        with self._slot_freed:
+            if generation != self._generation:
+                return
+            self._pending -= 1
+            self._slot_freed.notify()
+
+    def _get_executor(self):
+        # Created on first use so every forked server worker gets its own processes.
+        # Spawned rather than forked, so children don't inherit our threads and locks.
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            logger.info(f"Image worker pool started with {self.max_workers} processes")
+        return self._executor
+
+
+# Shared pool for the whole process, sized from config at startup
+image_workers = ImageWorkerPool()
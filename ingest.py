@@ -0,0 +1,31 @@
+import logging
+import tempfile
+
+from flask import Request, current_app
+
+# Create a logger
+logger = logging.getLogger(__name__)
+
+# Uploads up to this size stay in memory. Werkzeug spills anything over 500KB to a
+# temporary file, which nearly every phone photo exceeds; 16MB matches MAX_CONTENT_LENGTH.
+DEFAULT_SPOOL_BYTES = 16 * 1024 * 1024
+
+
+class SpooledUploadRequest(Request):
+    """Request that keeps uploaded files in memory up to UPLOAD_SPOOL_BYTES.
+
+    Werkzeug writes every upload over 500KB to a temporary file. Phone photos
+    are almost always bigger than that, and on Cloud Run the disk is RAM
+    anyway, so buffer in memory and only spill past the configured size.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        max_size = current_app.config.get('UPLOAD_SPOOL_BYTES', DEFAULT_SPOOL_BYTES)
+        return tempfile.SpooledTemporaryFile(max_size=max_size, mode='w+b')
+
+
+def upload_stream(file):
+    """The FileStorage's buffered stream, rewound for decoding"""
+    stream = file.stream
+    stream.seek(0)
+    return stream
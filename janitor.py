@@ -0,0 +1,176 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import namedtuple
+
+from models import db, Redesign
+from metrics import metrics
+
+# Create a logger
+logger = logging.getLogger(__name__)
+
+# Eviction rules for one directory (its files only, not subdirectories).
+# max_age is in seconds and max_bytes caps the directory's total size; None means no limit.
+# protect_results keeps files a Redesign row still points at.
+FolderPolicy = namedtuple('FolderPolicy', ['name', 'folder', 'max_age', 'max_bytes', 'protect_results'])
+
+# Paths checked against saved results per query
+PROTECTED_LOOKUP_BATCH = 500
+
+# Never touch files this new, they may still be in use by the request that wrote them
+MIN_AGE_SECONDS = 5 * 60
+
+
+class Janitor:
+    """Background thread that deletes old files and keeps directories under their size budgets"""
+
+    def __init__(self, app, policies, interval=600):
+        # Protected results are looked up in the database, which needs an app context
+        self.app = app
+        self.policies = policies
+        self.interval = interval
+        self.runs = 0
+        self.removed = 0
+        self.removed_bytes = 0
+        self.last_run = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the thread if it isn't running. Cheap enough to call on every request."""
+        if not self.interval or (self._thread and self._thread.is_alive()):
+            return
+        with self._lock:
+            # Started on first use so each forked server worker runs its own
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run_forever, name='janitor', daemon=True)
+            self._thread.start()
+            logger.info(f"Janitor started, running every {self.interval}s")
+
+    def run_once(self):
+        """Apply every policy once and update the disk usage gauges. Returns the number of files removed."""
+        now = time.time()
+        removed = 0
+        for policy in self.policies:
+            files = self._scan(policy.folder)
+            # Protected files count towards the budget but are never removed
+            total = sum(size for _, size, _ in files)
+            count = len(files)
+            if policy.protect_results and files:
+                protected = self._protected_paths([path for path, _, _ in files])
+                files = [f for f in files if os.path.relpath(f[0]) not in protected]
+
+            # Oldest first, so age expiry and size eviction both start from the front
+            files.sort(key=lambda f: f[2])
+            removed_here = 0
+            for path, size, mtime in files:
+                age = now - mtime
+                if age < MIN_AGE_SECONDS:
+                    break
+                expired = policy.max_age is not None and age > policy.max_age
+                over_budget = policy.max_bytes is not None and total > policy.max_bytes
+                if not expired and not over_budget:
+                    break
+                if self._remove(path, size):
+                    total -= size
+                    removed_here += 1
+
+            removed += removed_here
+
+            metrics.set_gauge(f'disk.{policy.name}.bytes', total)
+            metrics.set_gauge(f'disk.{policy.name}.files', count - removed_here)
+            if policy.max_bytes is not None and total > policy.max_bytes:
+                logger.warning(f"{policy.folder} is {total} bytes, over its {policy.max_bytes} byte budget")
+
+        try:
+            usage = shutil.disk_usage('.')
+            metrics.set_gauge('disk.free_bytes', usage.free)
+            metrics.set_gauge('disk.used_bytes', usage.used)
+        except OSError:
+            pass
+
+        with self._lock:
+            self.runs += 1
+            self.removed += removed
+            self.last_run = now
+        if removed:
+            logger.info(f"Janitor removed {removed} files")
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {'interval': self.interval, 'runs': self.runs, 'removed': self.removed,
+                    'removed_bytes': self.removed_bytes, 'last_run': self.last_run}
+
+    def _run_forever(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Error running janitor: {str(e)}")
+
+    def _scan(self, folder):
+        # (path, size, mtime) for every regular file, skipping dotfiles like .gitkeep
+        files = []
+        try:
+            for entry in os.scandir(folder):
+                if entry.name.startswith('.') or not entry.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((entry.path, stat.st_size, stat.st_mtime))
+        except FileNotFoundError:
+            pass
+        return files
+
+    def _protected_paths(self, paths):
+        # Which of these files a Redesign row points at, looked up by index in batches
+        paths = [os.path.relpath(path) for path in paths]
+        protected = set()
+        with self.app.app_context():
+            for start in range(0, len(paths), PROTECTED_LOOKUP_BATCH):
+                batch = paths[start:start + PROTECTED_LOOKUP_BATCH]
+                rows = db.session.query(Redesign.result_image_path).filter(
+                    Redesign.result_image_path.in_(batch)
+                )
+                protected.update(path for (path,) in rows)
+        return protected
+
+    def _remove(self, path, size):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Another worker's janitor got there first
+            return True
+        except OSError as e:
+            logger.error(f"Error removing {path}: {str(e)}")
+            return False
+        metrics.incr('janitor.removed')
+        with self._lock:
+            self.removed_bytes += size
+        return True
+
+
+def create_janitor(app, upload_folder, generated_folder, preview_folder, download_folder):
+    """Build the janitor with a policy per directory from the app's config"""
+    mb = 1024 * 1024
+    generated_max_mb = app.config['GENERATED_MAX_MB']
+    uploads_max_mb = app.config['UPLOADS_MAX_MB']
+    policies = [
+        # Handle-backed uploads, plus anything left behind by a failed upload
+        FolderPolicy('uploads', upload_folder, app.config['UPLOAD_HANDLE_TTL_SECONDS'],
+                     uploads_max_mb * mb if uploads_max_mb else None, False),
+        # Gemini outputs; ones saved to a user's history stay
+        FolderPolicy('generated', generated_folder, app.config['GENERATED_MAX_AGE_SECONDS'],
+                     generated_max_mb * mb if generated_max_mb else None, True),
+        # Previews belong to upload handles and downloads can be rendered again
+        FolderPolicy('previews', preview_folder, app.config['UPLOAD_HANDLE_TTL_SECONDS'], None, False),
+        FolderPolicy('downloads', download_folder, app.config['DOWNLOAD_TOKEN_TTL_SECONDS'], None, False)
+    ]
+    return Janitor(app, policies, interval=app.config['JANITOR_INTERVAL_SECONDS'])
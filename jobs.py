@@ -0,0 +1,158 @@
+import logging
+import threading
+from contextlib import nullcontext
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Create a logger
+logger = logging.getLogger(__name__)
+
+# Job states
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already waiting or running"""
+    pass
+
+
+class Job:
+    """A unit of background work and its progress"""
+
+    def __init__(self, manager, kind):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.status = JOB_QUEUED
+        self.progress = 0
+        self.message = 'Queued'
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        # Bumped on every change so pollers can wait for "something new"
+        self.version = 0
+        self.future = None
+        self._manager = manager
+
+    @property
+    def finished(self):
+        return self.status in (JOB_SUCCEEDED, JOB_FAILED)
+
+    def update(self, progress=None, message=None):
+        """Report progress from inside the running job"""
+        self._manager._update(self, progress=progress, message=message)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'result': self.result,
+            'error': self.error,
+            'version': self.version,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+
+
+class JobManager:
+    """Runs jobs on a bounded thread pool and keeps their state for polling"""
+
+    def __init__(self, max_workers=8, max_pending=64, job_ttl=3600, app=None):
+        # With an app, jobs run inside its app context so they can reach its services
+        self.app = app
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        # Created on first use so every forked worker gets its own threads
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix='job-worker'
+            )
+            logger.info(f"Job executor started with {self.max_workers} workers")
+        return self._executor
+
+    def submit(self, fn, *args, kind='generation', **kwargs):
+        """Queue fn(job, *args, **kwargs) and return the Job immediately"""
+        with self._lock:
+            self._sweep_locked()
+            pending = sum(1 for job in self._jobs.values() if not job.finished)
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"{pending} jobs already in flight")
+
+            job = Job(self, kind)
+            self._jobs[job.id] = job
+            executor = self._get_executor()
+
+        job.future = executor.submit(self._run, job, fn, args, kwargs)
+        logger.info(f"Queued {kind} job {job.id}")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id, since_version=None, timeout=30):
+        """Block until the job changes past since_version, finishes, or timeout expires"""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            job = self._jobs.get(job_id)
+            while job is not None and not job.finished:
+                if since_version is None or job.version > since_version:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            return job
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {'jobs': counts, 'max_workers': self.max_workers, 'max_pending': self.max_pending}
+
+    def _run(self, job, fn, args, kwargs):
+        self._set_state(job, status=JOB_RUNNING, message='Running')
+        try:
+            with self.app.app_context() if self.app else nullcontext():
+                result = fn(job, *args, **kwargs)
+            self._set_state(job, status=JOB_SUCCEEDED, progress=100, message='Done', result=result)
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed: {str(e)}")
+            self._set_state(job, status=JOB_FAILED, message='Failed', error=str(e))
+        return job
+
+    def _update(self, job, progress=None, message=None):
+        self._set_state(job, progress=progress, message=message)
+
+    def _set_state(self, job, **fields):
+        with self._changed:
+            for name, value in fields.items():
+                if value is not None:
+                    setattr(job, name, value)
+            job.updated_at = time.time()
+            job.version += 1
+            self._changed.notify_all()
+
+    def _sweep_locked(self):
+        # Forget finished jobs nobody has asked about for a while
+        cutoff = time.time() - self.job_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.updated_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
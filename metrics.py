@@ -0,0 +1,63 @@
+import logging
+import threading
+
+# Create a logger
+logger = logging.getLogger(__name__)
+
+
+class Metrics:
+    """Thread-safe in-process counters, gauges and timings"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._timings = {}
+        self._collectors = {}
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, seconds):
+        """Record one duration sample"""
+        with self._lock:
+            timing = self._timings.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0})
+            timing['count'] += 1
+            timing['total'] += seconds
+            timing['max'] = max(timing['max'], seconds)
+            timing['last'] = seconds
+
+    def register_collector(self, name, fn):
+        """Add a callable whose dict result is included in every snapshot"""
+        with self._lock:
+            self._collectors[name] = fn
+
+    def snapshot(self, collectors=None):
+        """Everything recorded so far, plus the registered collectors and any extra {name: fn} given"""
+        with self._lock:
+            timings = {}
+            for name, timing in self._timings.items():
+                timings[name] = dict(timing, avg=timing['total'] / timing['count'] if timing['count'] else 0.0)
+            result = {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'timings': timings
+            }
+            collectors = list(self._collectors.items()) + list((collectors or {}).items())
+
+        # Collectors take their own locks, so call them outside ours
+        for name, fn in collectors:
+            try:
+                result[name] = fn()
+            except Exception as e:
+                logger.error(f"Error collecting {name} metrics: {str(e)}")
+        return result
+
+
+# Shared registry for the whole process
+metrics = Metrics()
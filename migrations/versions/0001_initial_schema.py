@@ -0,0 +1,72 @@
+"""initial schema
+
+Revision ID: 0001_initial_schema
+Revises:
+Create Date: 2026-10-17 00:00:00
+
+Databases created earlier by db.create_all() already have some of these
+tables, so only the missing ones are created.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_initial_schema'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'users' not in existing:
+        op.create_table(
+            'users',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('email', sa.String(length=120), nullable=False),
+            sa.Column('password_hash', sa.String(length=200), nullable=False),
+            sa.Column('is_active', sa.Boolean(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('last_login', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('email')
+        )
+
+    if 'redesigns' not in existing:
+        op.create_table(
+            'redesigns',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('anonymous_id', sa.String(length=36), nullable=True),
+            sa.Column('original_image_path', sa.String(length=255), nullable=True),
+            sa.Column('inspiration_image_path', sa.String(length=255), nullable=True),
+            sa.Column('result_image_path', sa.String(length=255), nullable=True),
+            sa.Column('suggestions', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_redesigns_anonymous_id', 'redesigns', ['anonymous_id'])
+
+    if 'suggestion_cache' not in existing:
+        op.create_table(
+            'suggestion_cache',
+            sa.Column('key', sa.String(length=64), nullable=False),
+            sa.Column('model', sa.String(length=100), nullable=False),
+            sa.Column('prompt_version', sa.Integer(), nullable=False),
+            sa.Column('suggestions', sa.Text(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('key')
+        )
+        op.create_index('ix_suggestion_cache_expires_at', 'suggestion_cache', ['expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_suggestion_cache_expires_at', table_name='suggestion_cache')
+    op.drop_table('suggestion_cache')
+    op.drop_index('ix_redesigns_anonymous_id', table_name='redesigns')
+    op.drop_table('redesigns')
+    op.drop_table('users')
@@ -0,0 +1,37 @@
+"""download tokens
+
+Revision ID: 0002_download_tokens
+Revises: 0001_initial_schema
+Create Date: 2026-10-17 00:30:00
+
+Databases created earlier by db.create_all() may already have this table.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_download_tokens'
+down_revision = '0001_initial_schema'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'download_tokens' in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    op.create_table(
+        'download_tokens',
+        sa.Column('token', sa.String(length=36), nullable=False),
+        sa.Column('file_path', sa.String(length=255), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('token')
+    )
+    op.create_index('ix_download_tokens_expires_at', 'download_tokens', ['expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_download_tokens_expires_at', table_name='download_tokens')
+    op.drop_table('download_tokens')
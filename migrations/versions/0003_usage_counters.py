@@ -0,0 +1,49 @@
+"""usage counters
+
+Revision ID: 0003_usage_counters
+Revises: 0002_download_tokens
+Create Date: 2026-10-17 01:00:00
+
+Databases created earlier by db.create_all() may already have this table,
+with counters for some identities; only the missing ones are backfilled.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_usage_counters'
+down_revision = '0002_download_tokens'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'usage_counters' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'usage_counters',
+            sa.Column('identity', sa.String(length=64), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('identity')
+        )
+
+    # Start every counter from the redesigns already recorded
+    op.execute(
+        "INSERT INTO usage_counters (identity, count, updated_at) "
+        "SELECT 'user:' || CAST(user_id AS VARCHAR), COUNT(*), CURRENT_TIMESTAMP "
+        "FROM redesigns WHERE user_id IS NOT NULL "
+        "AND 'user:' || CAST(user_id AS VARCHAR) NOT IN (SELECT identity FROM usage_counters) "
+        "GROUP BY user_id"
+    )
+    op.execute(
+        "INSERT INTO usage_counters (identity, count, updated_at) "
+        "SELECT 'anon:' || anonymous_id, COUNT(*), CURRENT_TIMESTAMP "
+        "FROM redesigns WHERE anonymous_id IS NOT NULL "
+        "AND 'anon:' || anonymous_id NOT IN (SELECT identity FROM usage_counters) "
+        "GROUP BY anonymous_id"
+    )
+
+
+def downgrade():
+    op.drop_table('usage_counters')
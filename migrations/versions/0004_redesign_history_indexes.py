@@ -0,0 +1,59 @@
+"""redesign history indexes
+
+Revision ID: 0004_redesign_history_indexes
+Revises: 0003_usage_counters
+Create Date: 2026-10-17 01:30:00
+
+Replaces the single-column anonymous_id index with (anonymous_id, created_at)
+and adds (user_id, created_at), so "newest redesign for this owner" and
+per-owner counts are index range scans. result_image_path is indexed for
+the janitor's "is this file still saved?" lookups. On PostgreSQL the
+indexes are built concurrently so the table stays writable. Databases
+created earlier by db.create_all() may already have some of these indexes,
+so only the missing ones are created.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_redesign_history_indexes'
+down_revision = '0003_usage_counters'
+branch_labels = None
+depends_on = None
+
+
+def _concurrently():
+    return op.get_context().dialect.name == 'postgresql'
+
+
+INDEXES = [
+    ('ix_redesigns_user_id_created_at', ['user_id', 'created_at']),
+    ('ix_redesigns_anonymous_id_created_at', ['anonymous_id', 'created_at']),
+    ('ix_redesigns_result_image_path', ['result_image_path'])
+]
+
+
+def upgrade():
+    existing = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('redesigns')}
+    missing = [(name, columns) for name, columns in INDEXES if name not in existing]
+
+    if _concurrently():
+        # CREATE INDEX CONCURRENTLY can't run inside a transaction
+        with op.get_context().autocommit_block():
+            for name, columns in missing:
+                op.create_index(name, 'redesigns', columns, postgresql_concurrently=True)
+    else:
+        for name, columns in missing:
+            op.create_index(name, 'redesigns', columns)
+
+    # The composite index leads with anonymous_id, so this one only slows writes now
+    if 'ix_redesigns_anonymous_id' in existing:
+        op.drop_index('ix_redesigns_anonymous_id', table_name='redesigns')
+
+
+def downgrade():
+    op.create_index('ix_redesigns_anonymous_id', 'redesigns', ['anonymous_id'])
+    op.drop_index('ix_redesigns_result_image_path', table_name='redesigns')
+    op.drop_index('ix_redesigns_anonymous_id_created_at', table_name='redesigns')
+    op.drop_index('ix_redesigns_user_id_created_at', table_name='redesigns')
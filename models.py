@@ -42,10 +42,17 @@ class User(db.Model):
 class Redesign(db.Model):
     """Model to track user redesigns"""
     __tablename__ = 'redesigns'
+    # History lookups filter on the owner and want the newest first
+    __table_args__ = (
+        db.Index('ix_redesigns_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_redesigns_anonymous_id_created_at', 'anonymous_id', 'created_at'),
+        # The janitor keeps generated files that a redesign still points at
+        db.Index('ix_redesigns_result_image_path', 'result_image_path'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
-    anonymous_id = db.Column(db.String(36), nullable=True, index=True)
+    anonymous_id = db.Column(db.String(36), nullable=True)
     original_image_path = db.Column(db.String(255), nullable=True)
     inspiration_image_path = db.Column(db.String(255), nullable=True)
     result_image_path = db.Column(db.String(255), nullable=True)
@@ -53,4 +60,45 @@ class Redesign(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
-        return f'<Redesign {self.id}>' 
\ No newline at end of file
+        return f'<Redesign {self.id}>'
+
+# Running redesign count per user or anonymous visitor
+class UsageCounter(db.Model):
+    """Model to check usage quotas without counting redesigns on every request"""
+    __tablename__ = 'usage_counters'
+    
+    # 'user:<id>' or 'anon:<anonymous id>'
+    identity = db.Column(db.String(64), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<UsageCounter {self.identity} {self.count}>'
+
+# Cached Claude suggestions for a pair of images
+class SuggestionCacheEntry(db.Model):
+    """Model to persist suggestion results across restarts and instances"""
+    __tablename__ = 'suggestion_cache'
+    
+    key = db.Column(db.String(64), primary_key=True)
+    model = db.Column(db.String(100), nullable=False)
+    prompt_version = db.Column(db.Integer, nullable=False)
+    suggestions = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<SuggestionCacheEntry {self.key[:12]}>'
+
+# Download links handed out by /api/save-results
+class DownloadToken(db.Model):
+    """Model to resolve download links on any worker or instance"""
+    __tablename__ = 'download_tokens'
+    
+    token = db.Column(db.String(36), primary_key=True)
+    file_path = db.Column(db.String(255), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<DownloadToken {self.token}>'
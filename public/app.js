@@ -94,6 +94,9 @@ document.addEventListener('DOMContentLoaded', () => {
     let suggestions = [];
     let generatedImagesHistory = []; // Store history of generated images
     let originalImageUrl = null; // Store URL of original image for comparison
+    let originalImageHandle = null; // Server-side handle for the processed original image
+    let inspirationImageHandle = null; // Server-side handle for the processed inspiration image
+    let redesignId = null; // Server-side record of the current redesign, updated when results are saved
     
     // Constants
     const MAX_ANONYMOUS_USAGE = 3;
@@ -522,6 +525,11 @@ document.addEventListener('DOMContentLoaded', () => {
         return statusElement;
     }
     
+    // Image handles refer to images the server already holds
+    function isImageHandle(value) {
+        return typeof value === 'string' && (value.startsWith('upload:') || value.startsWith('generated:'));
+    }
+    
     // Check if file is likely HEIC format
     function isHeicImage(file) {
         const fileName = file.name.toLowerCase();
@@ -530,6 +538,22 @@ document.addEventListener('DOMContentLoaded', () => {
                fileType.includes('heic') || fileType.includes('heif');
     }
     
+    // Get a browser-displayable preview and a reusable handle for an image (used for HEIC)
+    async function requestImagePreview(file) {
+        const formData = new FormData();
+        formData.append('image', file);
+        
+        const response = await fetch('/api/image-preview', {
+            method: 'POST',
+            body: formData
+        });
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || 'Preview failed');
+        }
+        return data;
+    }
+    
     // Handle original image upload
     originalImageUpload.addEventListener('change', (e) => {
         const file = e.target.files[0];
@@ -544,6 +568,7 @@ document.addEventListener('DOMContentLoaded', () => {
             }
             
             originalSelectedImage = file;
+            originalImageHandle = null;
             
             // For non-HEIC images, display preview immediately
             if (!isHeicImage(file)) {
@@ -563,31 +588,15 @@ document.addEventListener('DOMContentLoaded', () => {
                 originalPreview.src = 'data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMjAwIiBoZWlnaHQ9IjIwMCIgeG1sbnM9Imh0dHA6Ly93d3cudzMub3JnLzIwMDAvc3ZnIj48cmVjdCB3aWR0aD0iMjAwIiBoZWlnaHQ9IjIwMCIgZmlsbD0iI2YwZjBmMCIvPjx0ZXh0IHg9IjUwJSIgeT0iNTAlIiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTYiIHRleHQtYW5jaG9yPSJtaWRkbGUiIGRvbWluYW50LWJhc2VsaW5lPSJtaWRkbGUiIGZpbGw9IiM1NTUiPkNvbnZlcnRpbmcgSEVJQy4uLjwvdGV4dD48L3N2Zz4=';
                 updateRedesignButtonState();
                 
-                // Create a small form data to test-process this HEIC file to get a JPEG version
-                const testFormData = new FormData();
-                testFormData.append('image', file);
-                testFormData.append('message', 'Processing HEIC preview');
-                
-                // Send to process on the server
-                fetch('/api/chat-with-image', {
-                    method: 'POST',
-                    body: testFormData
-                })
-                .then(response => response.json())
+                // Ask the server for a small JPEG preview and a handle to the full image
+                requestImagePreview(file)
                 .then(data => {
-                    // If we got images back, update our preview with the processed version
-                    if (data.images && data.images.length > 0) {
-                        console.log('Received processed HEIC image:', data.images[0]);
-                        
-                        // Update the preview with processed image
-                        fetch(data.images[0])
-                            .then(response => response.blob())
-                            .then(blob => {
-                                const url = URL.createObjectURL(blob);
-                                originalPreview.src = url;
-                                originalImageUrl = url; // Update the original image URL to the processed version
-                                console.log('Original image preview updated with processed version');
-                            });
+                    if (data.preview_url) {
+                        console.log('Received HEIC preview:', data.preview_url);
+                        originalImageHandle = data.handle || null;
+                        originalPreview.src = data.preview_url;
+                        originalImageUrl = data.preview_url; // Compare against the processed version
+                        console.log('Original image preview updated with processed version');
                     }
                     
                     // Remove processing status 
@@ -610,6 +619,7 @@ document.addEventListener('DOMContentLoaded', () => {
     originalRemoveImageBtn.addEventListener('click', () => {
         console.log('Original image removed');
         originalSelectedImage = null;
+        originalImageHandle = null;
         originalPreview.src = '';
         originalImageUrl = null;
         originalImageUpload.value = '';
@@ -632,6 +642,7 @@ document.addEventListener('DOMContentLoaded', () => {
             }
             
             inspirationSelectedImage = file;
+            inspirationImageHandle = null;
             
             // For non-HEIC images, display preview immediately
             if (!isHeicImage(file)) {
@@ -650,30 +661,14 @@ document.addEventListener('DOMContentLoaded', () => {
                 inspirationPreview.src = 'data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMjAwIiBoZWlnaHQ9IjIwMCIgeG1sbnM9Imh0dHA6Ly93d3cudzMub3JnLzIwMDAvc3ZnIj48cmVjdCB3aWR0aD0iMjAwIiBoZWlnaHQ9IjIwMCIgZmlsbD0iI2YwZjBmMCIvPjx0ZXh0IHg9IjUwJSIgeT0iNTAlIiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTYiIHRleHQtYW5jaG9yPSJtaWRkbGUiIGRvbWluYW50LWJhc2VsaW5lPSJtaWRkbGUiIGZpbGw9IiM1NTUiPkNvbnZlcnRpbmcgSEVJQy4uLjwvdGV4dD48L3N2Zz4=';
                 updateRedesignButtonState();
                 
-                // Create a small form data to test-process this HEIC file to get a JPEG version
-                const testFormData = new FormData();
-                testFormData.append('image', file);
-                testFormData.append('message', 'Processing HEIC preview');
-                
-                // Send to process on the server
-                fetch('/api/chat-with-image', {
-                    method: 'POST',
-                    body: testFormData
-                })
-                .then(response => response.json())
+                // Ask the server for a small JPEG preview and a handle to the full image
+                requestImagePreview(file)
                 .then(data => {
-                    // If we got images back, update our preview with the processed version
-                    if (data.images && data.images.length > 0) {
-                        console.log('Received processed HEIC image:', data.images[0]);
-                        
-                        // Update the preview with processed image
-                        fetch(data.images[0])
-                            .then(response => response.blob())
-                            .then(blob => {
-                                const url = URL.createObjectURL(blob);
-                                inspirationPreview.src = url;
-                                console.log('Inspiration image preview updated with processed version');
-                            });
+                    if (data.preview_url) {
+                        console.log('Received HEIC preview:', data.preview_url);
+                        inspirationImageHandle = data.handle || null;
+                        inspirationPreview.src = data.preview_url;
+                        console.log('Inspiration image preview updated with processed version');
                     }
                     
                     // Remove processing status 
@@ -696,6 +691,7 @@ document.addEventListener('DOMContentLoaded', () => {
     inspirationRemoveImageBtn.addEventListener('click', () => {
         console.log('Inspiration image removed');
         inspirationSelectedImage = null;
+        inspirationImageHandle = null;
         inspirationPreview.src = '';
         inspirationImageUpload.value = '';
         inspirationPreviewContainer.classList.add('hidden');
@@ -871,143 +867,159 @@ document.addEventListener('DOMContentLoaded', () => {
         isProcessing = false;
     }
     
-    // Process a single suggestion with Gemini
-    async function processSuggestion(sourceImage, suggestionText, suggestionIndex) {
+    // Show a finished redesign in the result panel
+    function showSuggestionResult(suggestionIndex) {
+        const entry = generatedImagesHistory[suggestionIndex];
+        if (!entry) return;
+        
+        suggestionStatuses.forEach(status => status.classList.remove('selected'));
+        suggestionStatuses[suggestionIndex].classList.add('selected');
+        currentSuggestionNumber.textContent = suggestionIndex + 1;
+        currentSuggestionIndex = suggestionIndex;
+        
+        resultImage.src = entry.imageUrl;
+        resultImage.classList.remove('hidden');
+        resultPlaceholder.classList.add('hidden');
+        resultLoadingSpinner.classList.add('hidden');
+        setupBeforeAfterComparison();
+        updateDownloadButtonState();
+    }
+    
+    // Let users switch between finished redesigns
+    suggestionStatuses.forEach((status, index) => {
+        status.addEventListener('click', () => {
+            if (status.classList.contains('completed')) {
+                showSuggestionResult(index);
+            }
+        });
+    });
+    
+    // Parse a Server-Sent Events stream from a fetch response, calling onEvent(name, data)
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let eventName = 'message';
+                let dataLines = [];
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        eventName = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        dataLines.push(line.slice(5).trim());
+                    }
+                });
+                if (dataLines.length > 0) {
+                    onEvent(eventName, JSON.parse(dataLines.join('\n')));
+                }
+            }
+        }
+    }
+    
+    // Render every suggestion in one batch request, showing each result as it arrives
+    async function processAllSuggestions(sourceImage, allSuggestions) {
         try {
-            console.log(`Processing suggestion ${suggestionIndex + 1}: "${suggestionText}"`);
-            
-            // Update UI
-            currentSuggestionNumber.textContent = suggestionIndex + 1;
-            
-            // Mark all previous steps as completed
-            for (let i = 0; i < suggestionIndex; i++) {
+            // Show every suggestion as loading
+            allSuggestions.forEach((_, i) => {
                 suggestionStatuses[i].classList.remove('active');
-                suggestionStatuses[i].classList.remove('loading');
-                suggestionStatuses[i].classList.add('completed');
-            }
-            
-            // Show this step as loading - replaces active with loading
-            suggestionStatuses[suggestionIndex].classList.remove('active');
-            suggestionStatuses[suggestionIndex].classList.add('loading');
-            
-            // Show result as loading
+                suggestionStatuses[i].classList.add('loading');
+            });
             resultPlaceholder.classList.add('hidden');
             resultImage.classList.add('hidden');
             resultLoadingSpinner.classList.remove('hidden');
+            cornerLoadingSpinner.classList.remove('hidden');
             
-            // Use URL directly if sourceImage is a string URL
-            let formData = new FormData();
-            let imageFile;
-            
-            // Handle different sourceImage types
-            if (typeof sourceImage === 'string') {
-                // It's a URL - need to fetch it and convert to file
-                console.log('Source is a URL, fetching...');
-                try {
-                    const response = await fetch(sourceImage);
-                    const blob = await response.blob();
+            // Send the original image (or its handle) once along with every suggestion
+            const formData = new FormData();
+            if (isImageHandle(sourceImage)) {
+                formData.append('image_handle', sourceImage);
+            } else {
+                let imageFile = sourceImage;
+                if (typeof sourceImage === 'string') {
+                    const imageResponse = await fetch(sourceImage);
+                    const blob = await imageResponse.blob();
                     imageFile = new File([blob], "processed_image.jpg", { type: 'image/jpeg' });
-                } catch (e) {
-                    console.error('Error fetching source image:', e);
-                    throw new Error('Could not load source image');
                 }
-            } else if (sourceImage instanceof File) {
-                // It's already a file
-                imageFile = sourceImage;
-            } else {
-                throw new Error('Invalid source image format');
+                formData.append('image', imageFile);
             }
+            allSuggestions.forEach(suggestion => formData.append('message', suggestion.description));
             
-            // Add image and suggestion text to form data
-            formData.append('image', imageFile);
-            formData.append('message', suggestionText);
-            
-            // Prepare headers for authentication
             const headers = {};
             if (authState.token) {
                 headers['Authorization'] = `Bearer ${authState.token}`;
             }
             
-            // Show loading spinner in corner while processing
-            cornerLoadingSpinner.classList.remove('hidden');
-            
-            // Make the API request with proper authentication
-            console.log('Sending suggestion to API');
-            const response = await fetch('/api/chat-with-image', {
+            const response = await fetch('/api/jobs/batch', {
                 method: 'POST',
                 headers: headers,
                 body: formData
             });
             
-            const data = await response.json();
-            
-            // Handle errors
             if (!response.ok) {
-                throw new Error(data.error || 'Failed to process suggestion');
+                const errorData = await response.json();
+                throw new Error(errorData.error || 'Failed to process suggestions');
             }
             
-            // Hide corner spinner
-            cornerLoadingSpinner.classList.add('hidden');
-            
-            // Log response
-            console.log('Received response:', data);
-            
-            // Update UI with the image result
-            if (data.images && data.images.length > 0) {
-                const imageUrl = data.images[0];
-                resultImage.src = imageUrl;
-                resultImage.classList.remove('hidden');
-                resultLoadingSpinner.classList.add('hidden');
-                
-                // Update the "before after" comparison if available
-                setupBeforeAfterComparison();
+            let shownFirst = false;
+            await readEventStream(response, (eventName, data) => {
+                if (eventName !== 'result') return;
                 
-                // Save the generated image to history
-                generatedImagesHistory.push({
-                    index: suggestionIndex,
-                    imageUrl: imageUrl,
-                    description: suggestionText
-                });
-                
-                // Update download button state
-                updateDownloadButtonState();
-                
-                // Mark this suggestion as completed
-                suggestionStatuses[suggestionIndex].classList.remove('loading');
-                suggestionStatuses[suggestionIndex].classList.add('completed');
+                const index = data.index;
+                suggestionStatuses[index].classList.remove('loading');
                 
-                // Activate next suggestion if available
-                if (suggestionIndex < suggestionStatuses.length - 1) {
-                    suggestionStatuses[suggestionIndex + 1].classList.add('active');
+                if (data.status === 'succeeded' && data.result.images && data.result.images.length > 0) {
+                    generatedImagesHistory[index] = {
+                        index: index,
+                        imageUrl: data.result.images[0],
+                        description: allSuggestions[index].description
+                    };
+                    suggestionStatuses[index].classList.add('completed');
+                    
+                    // Show whichever redesign finishes first
+                    if (!shownFirst) {
+                        shownFirst = true;
+                        showSuggestionResult(index);
+                    }
+                } else {
+                    console.error(`Error processing suggestion ${index + 1}:`, data.error);
+                    suggestionStatuses[index].classList.add('error');
                 }
-                
-                // Return success
-                return {
-                    success: true,
-                    resultImageUrl: imageUrl
-                };
-            } else {
-                throw new Error('No image was generated');
-            }
-        } catch (error) {
-            console.error(`Error processing suggestion ${suggestionIndex + 1}:`, error);
+            });
             
-            // Update UI to show error state
-            suggestionStatuses[suggestionIndex].classList.remove('loading');
-            suggestionStatuses[suggestionIndex].classList.add('error');
+            // Anything the stream never reported on has failed
+            allSuggestions.forEach((_, i) => {
+                if (suggestionStatuses[i].classList.contains('loading')) {
+                    suggestionStatuses[i].classList.remove('loading');
+                    suggestionStatuses[i].classList.add('error');
+                }
+            });
             
-            // Hide corner spinner
             cornerLoadingSpinner.classList.add('hidden');
-            
-            // Show placeholder for error
+            if (!shownFirst) {
+                resultLoadingSpinner.classList.add('hidden');
+                resultPlaceholder.classList.remove('hidden');
+            }
+        } catch (error) {
+            console.error('Error processing suggestions:', error);
+            allSuggestions.forEach((_, i) => {
+                if (suggestionStatuses[i].classList.contains('loading')) {
+                    suggestionStatuses[i].classList.remove('loading');
+                    suggestionStatuses[i].classList.add('error');
+                }
+            });
+            cornerLoadingSpinner.classList.add('hidden');
             resultLoadingSpinner.classList.add('hidden');
             resultPlaceholder.classList.remove('hidden');
-            
-            // Return failure
-            return {
-                success: false,
-                error: error.message
-            };
         }
     }
     
@@ -1041,20 +1053,30 @@ document.addEventListener('DOMContentLoaded', () => {
             // Reset state
             generatedImagesHistory = [];
             suggestions = [];
+            redesignId = null;
             currentSuggestionIndex = 0;
             
             // Reset UI
             document.querySelectorAll('.suggestion-status').forEach(el => {
-                el.classList.remove('active', 'completed', 'loading');
+                el.classList.remove('active', 'completed', 'loading', 'error', 'selected');
             });
             document.querySelectorAll('.suggestion-text').forEach(el => {
                 el.textContent = '';
             });
             
             // Create form data with both images
+            // Reuse server-side handles when the images were already uploaded
             const formData = new FormData();
-            formData.append('original', originalSelectedImage);
-            formData.append('inspiration', inspirationSelectedImage);
+            if (originalImageHandle) {
+                formData.append('original_handle', originalImageHandle);
+            } else {
+                formData.append('original', originalSelectedImage);
+            }
+            if (inspirationImageHandle) {
+                formData.append('inspiration_handle', inspirationImageHandle);
+            } else {
+                formData.append('inspiration', inspirationSelectedImage);
+            }
             
             // Prepare headers for authentication
             const headers = {};
@@ -1070,7 +1092,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 setTimeout(() => reject(new Error('Request timed out after 120 seconds')), 120000);
             });
             
-            const fetchPromise = fetch('/api/claude-suggestions', {
+            const fetchPromise = fetch('/api/claude-suggestions/stream', {
                 method: 'POST',
                 headers: headers,
                 body: formData
@@ -1125,41 +1147,54 @@ document.addEventListener('DOMContentLoaded', () => {
                 return;
             }
             
-            // Parse JSON response
-            let data;
+            // Show each suggestion as soon as the server streams it
+            let data = null;
+            let streamError = null;
+            const showSuggestion = (index, suggestion) => {
+                if (index === 0) {
+                    // First suggestion is in, show the results area right away
+                    suggestionsPlaceholder.classList.add('hidden');
+                    suggestionStatuses[0].classList.add('active');
+                    suggestionsClickHint.classList.remove('hidden');
+                    resultsContainer.classList.remove('hidden');
+                }
+                suggestionTexts[index].textContent = suggestion.title;
+            };
+            
             try {
-                data = await response.json();
+                await readEventStream(response, (eventName, eventData) => {
+                    if (eventName === 'suggestion') {
+                        showSuggestion(eventData.index, eventData.suggestion);
+                    } else if (eventName === 'done') {
+                        data = eventData;
+                    } else if (eventName === 'error') {
+                        streamError = eventData.error;
+                    }
+                });
             } catch (e) {
-                console.error('Error parsing response:', e);
-                showAlert('Error: Unable to parse server response. Please try again.', true);
+                console.error('Error reading suggestion stream:', e);
+                streamError = 'Unable to read server response. Please try again.';
+            }
+            
+            if (!data) {
+                showAlert(`Error: ${streamError || 'No suggestions received. Please try again.'}`, true);
                 resetProcessing();
                 return;
             }
             
-            // Use the suggestions
+            // Use the final suggestions and remember the server-side copies of the images
             suggestions = data.suggestions;
+            originalImageHandle = data.original_handle || originalImageHandle;
+            inspirationImageHandle = data.inspiration_handle || inspirationImageHandle;
+            redesignId = data.redesign_id || null;
             console.log('Received suggestions:', suggestions);
-            
-            // Update the UI with suggestions
-            suggestionsPlaceholder.classList.add('hidden');
-            
-            for (let i = 0; i < suggestions.length; i++) {
-                const suggestion = suggestions[i];
-                suggestionTexts[i].textContent = suggestion.title;
-            }
-            
-            // Activate the first suggestion
-            suggestionStatuses[0].classList.add('active');
-            suggestionsClickHint.classList.remove('hidden');
-            
-            // Show results container
-            resultsContainer.classList.remove('hidden');
+            suggestions.forEach((suggestion, i) => showSuggestion(i, suggestion));
             
             // Update usage count
             checkAuthStatus();
             
-            // Process first suggestion automatically
-            await processSuggestion(originalImageUrl, suggestions[0].description, 0);
+            // Render all suggestions at once
+            await processAllSuggestions(originalImageHandle || originalImageUrl, suggestions);
             
         } catch (error) {
             console.error('Error in redesign process:', error);
@@ -1381,7 +1416,8 @@ document.addEventListener('DOMContentLoaded', () => {
             headers: headers,
             body: JSON.stringify({
                 result_image: selectedImage.imageUrl,
-                suggestions: suggestions
+                suggestions: suggestions,
+                redesign_id: redesignId
             })
         })
         .then(response => {
@@ -0,0 +1,88 @@
+"""Measure how long `import app` takes, i.e. the work a cold start does before serving.
+
+Examples:
+    python scripts/importtime_benchmark.py
+    python scripts/importtime_benchmark.py --runs 5 --top 15 --history logs/importtime.jsonl
+
+Each run imports the app in a fresh interpreter under `python -X importtime`
+and reports the wall time plus the slowest modules (cumulative microseconds).
+With --history, one JSON line per invocation is appended so results can be
+compared across commits.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_once(module):
+    env = dict(os.environ, FLASK_CONFIG=os.environ.get('FLASK_CONFIG', 'production'))
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        sys.exit(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    # Lines look like "import time:   self [us] |  cumulative | imported package"
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace('import time:', '|', 1).split('|')]
+        modules[name] = max(modules.get(name, 0), int(cumulative_us))
+    return elapsed, modules
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='app', help='Module to import')
+    parser.add_argument('--runs', type=int, default=3, help='Fresh interpreters to average over')
+    parser.add_argument('--top', type=int, default=10, help='Slowest top-level modules to list')
+    parser.add_argument('--history', help='Append the result as a JSON line to this file')
+    args = parser.parse_args()
+
+    timings = []
+    modules = {}
+    for _ in range(args.runs):
+        elapsed, modules = import_once(args.module)
+        timings.append(elapsed)
+
+    # Only top-level packages, so nested imports aren't counted twice
+    top_level = {name: us for name, us in modules.items() if '.' not in name}
+    slowest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:args.top]
+
+    print(f"import {args.module}: {args.runs} runs")
+    print(f"  wall time   median {statistics.median(timings) * 1000:.0f}ms  "
+          f"min {min(timings) * 1000:.0f}ms  max {max(timings) * 1000:.0f}ms")
+    print(f"  importtime  {modules.get(args.module, 0) / 1000:.0f}ms for {args.module} itself")
+    for name, us in slowest:
+        print(f"    {us / 1000:8.1f}ms  {name}")
+
+    if args.history:
+        with open(args.history, 'a') as f:
+            f.write(json.dumps({
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'revision': git_revision(),
+                'module': args.module,
+                'median_ms': round(statistics.median(timings) * 1000),
+                'module_ms': round(modules.get(args.module, 0) / 1000),
+                'slowest': {name: round(us / 1000) for name, us in slowest}
+            }) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Concurrent load test against a running instance.
+
+Examples:
+    python scripts/load_test.py --url http://localhost:8080 --path /healthz -c 32 -n 2000
+    python scripts/load_test.py --path /api/image-preview --file room.jpg --unique -c 8 -n 100
+
+Run it against `python app.py` and against `gunicorn -c gunicorn.conf.py app:app`
+to compare throughput and latency under concurrency.
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+from collections import Counter
+
+import requests
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8080', help='Base URL of the server')
+    parser.add_argument('--path', default='/healthz', help='Path to request')
+    parser.add_argument('-c', '--concurrency', type=int, default=16, help='Parallel clients')
+    parser.add_argument('-n', '--requests', type=int, default=500, help='Total requests')
+    parser.add_argument('--file', help='Image to POST as the multipart "image" field')
+    parser.add_argument('--field', action='append', default=[], help='Extra form field as name=value (POSTs)')
+    parser.add_argument('--unique', action='store_true',
+                        help='Append random bytes to the file so content-addressed caches miss')
+    parser.add_argument('--timeout', type=float, default=180, help='Per-request timeout in seconds')
+    args = parser.parse_args()
+
+    payload = None
+    if args.file:
+        with open(args.file, 'rb') as f:
+            payload = f.read()
+    fields = dict(field.split('=', 1) for field in args.field)
+
+    url = args.url.rstrip('/') + args.path
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    remaining = [args.requests]
+
+    def client():
+        session = requests.Session()
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+
+            start = time.perf_counter()
+            try:
+                if payload is not None or fields:
+                    files = None
+                    if payload is not None:
+                        body = payload + os.urandom(16) if args.unique else payload
+                        files = {'image': (os.path.basename(args.file), body)}
+                    response = session.post(url, data=fields, files=files, timeout=args.timeout)
+                else:
+                    response = session.get(url, timeout=args.timeout)
+                status = response.status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    print(f"{url}: {args.requests} requests, concurrency {args.concurrency}")
+    print(f"  duration    {duration:.2f}s")
+    print(f"  throughput  {len(latencies) / duration:.1f} req/s")
+    print(f"  latency     mean {statistics.mean(latencies) * 1000:.0f}ms  "
+          f"p50 {percentile(latencies, 0.50) * 1000:.0f}ms  "
+          f"p95 {percentile(latencies, 0.95) * 1000:.0f}ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:.0f}ms")
+    print(f"  statuses    {dict(statuses)}")
+
+
+if __name__ == '__main__':
+    main()
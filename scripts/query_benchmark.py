@@ -0,0 +1,161 @@
+"""Seed a database with redesign history and time every query the app runs against it.
+
+Examples:
+    python scripts/query_benchmark.py --rows 2000000
+    python scripts/query_benchmark.py --url postgresql://localhost/bench --rows 5000000
+    python scripts/query_benchmark.py --rows 2000000 --without-history-indexes
+
+The database at --url (a throwaway SQLite file by default) is created from the
+models and seeded once; later runs against the same URL reuse the rows. Each
+access pattern from app.py and auth.py is timed over --iterations random
+owners and its query plan is printed, so index changes can be compared.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, select, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Redesign, UsageCounter  # noqa: E402
+
+HISTORY_INDEXES = ('ix_redesigns_user_id_created_at', 'ix_redesigns_anonymous_id_created_at',
+                   'ix_redesigns_result_image_path')
+
+
+def seed(engine, rows, users, anonymous, batch=50000):
+    redesigns = Redesign.__table__
+    user_ids = list(range(1, users + 1))
+    anonymous_ids = [str(uuid.uuid4()) for _ in range(anonymous)]
+    start = datetime.utcnow() - timedelta(days=365)
+
+    print(f"Seeding {rows} redesigns for {users} users and {anonymous} anonymous visitors...")
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(db.metadata.tables['users'].insert(), [
+            {'id': user_id, 'email': f'user{user_id}@example.com', 'password_hash': 'x', 'is_active': True}
+            for user_id in user_ids
+        ])
+    for offset in range(0, rows, batch):
+        values = []
+        for i in range(offset, min(rows, offset + batch)):
+            # About a third of redesigns are anonymous, like the free tier
+            owner = {'user_id': random.choice(user_ids), 'anonymous_id': None} if i % 3 \
+                else {'user_id': None, 'anonymous_id': random.choice(anonymous_ids)}
+            values.append(dict(owner,
+                               original_image_path=f'uploads/{i}.jpg',
+                               inspiration_image_path=f'uploads/{i}_inspiration.jpg',
+                               result_image_path=f'generated/image_{i}.png' if i % 2 else None,
+                               created_at=start + timedelta(seconds=i * 7)))
+        with engine.begin() as conn:
+            conn.execute(redesigns.insert(), values)
+
+    # The counters the app keeps alongside the rows
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO usage_counters (identity, count) "
+            "SELECT 'user:' || CAST(user_id AS VARCHAR), COUNT(*) FROM redesigns "
+            "WHERE user_id IS NOT NULL GROUP BY user_id"))
+        conn.execute(text(
+            "INSERT INTO usage_counters (identity, count) "
+            "SELECT 'anon:' || anonymous_id, COUNT(*) FROM redesigns "
+            "WHERE anonymous_id IS NOT NULL GROUP BY anonymous_id"))
+        if engine.dialect.name in ('postgresql', 'sqlite'):
+            conn.execute(text('ANALYZE'))
+    print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+
+def access_patterns(rows):
+    """(name, where it runs, function of (user_id, anonymous_id) returning a statement)"""
+    r = Redesign
+    return [
+        ('newest redesign by user', 'app.save_results',
+         lambda u, a: select(r.id).where(r.user_id == u).order_by(r.created_at.desc()).limit(1)),
+        ('newest redesign by anonymous id', 'app.save_results',
+         lambda u, a: select(r.id).where(r.anonymous_id == a).order_by(r.created_at.desc()).limit(1)),
+        ('count by anonymous id', 'usage counter fallback / before usage counters',
+         lambda u, a: select(func.count()).select_from(r).where(r.anonymous_id == a)),
+        ('count by user', 'usage counter fallback / before usage counters',
+         lambda u, a: select(func.count()).select_from(r).where(r.user_id == u)),
+        ('usage counter lookup', 'auth.auth_required, check_anonymous, get_user, /api/usage/count',
+         lambda u, a: select(UsageCounter.count).where(UsageCounter.identity == f'anon:{a}')),
+        ('redesigns to transfer', 'auth.register, auth.login',
+         lambda u, a: select(r.id).where(r.anonymous_id == a)),
+        ('saved results among 500 files', 'janitor',
+         lambda u, a: select(r.result_image_path).where(
+             r.result_image_path.in_([f'generated/image_{random.randrange(rows)}.png' for _ in range(500)]))),
+    ]
+
+
+def explain(conn, statement):
+    compiled = str(statement.compile(conn.engine, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = conn.execute(text(prefix + compiled)).fetchall()
+    return [' | '.join(str(col) for col in row) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='sqlite:////tmp/redesign_query_benchmark.db', help='Database URL')
+    parser.add_argument('--rows', type=int, default=1000000, help='Redesigns to seed')
+    parser.add_argument('--users', type=int, default=20000, help='Registered users to spread them over')
+    parser.add_argument('--anonymous', type=int, default=100000, help='Anonymous visitors to spread them over')
+    parser.add_argument('--iterations', type=int, default=200, help='Timed queries per access pattern')
+    parser.add_argument('--without-history-indexes', action='store_true',
+                        help='Drop the indexes added for these queries first, to measure the old schema')
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    db.metadata.create_all(engine)
+    with engine.connect() as conn:
+        existing = conn.execute(select(func.count()).select_from(Redesign.__table__)).scalar()
+    if existing == 0:
+        seed(engine, args.rows, args.users, args.anonymous)
+    else:
+        print(f"Reusing {existing} seeded redesigns")
+
+    with engine.begin() as conn:
+        for name in HISTORY_INDEXES:
+            conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
+        if args.without_history_indexes:
+            # What the schema looked like before: only anonymous_id indexed
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_redesigns_anonymous_id ON redesigns (anonymous_id)'))
+        else:
+            conn.execute(text('DROP INDEX IF EXISTS ix_redesigns_anonymous_id'))
+            for index in Redesign.__table__.indexes:
+                index.create(conn)
+
+    with engine.connect() as conn:
+        user_ids = [row[0] for row in conn.execute(text('SELECT id FROM users'))]
+        anonymous_ids = [row[0] for row in conn.execute(text(
+            'SELECT DISTINCT anonymous_id FROM redesigns WHERE anonymous_id IS NOT NULL LIMIT 10000'))]
+
+        print(f"\n{'pattern':34} {'p50':>9} {'p95':>9} {'max':>9}  used by")
+        plans = []
+        for name, used_by, build in access_patterns(existing or args.rows):
+            timings = []
+            for _ in range(args.iterations):
+                statement = build(random.choice(user_ids), random.choice(anonymous_ids))
+                started = time.perf_counter()
+                conn.execute(statement).fetchall()
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            print(f"{name:34} {statistics.median(timings) * 1000:8.2f}ms "
+                  f"{timings[int(len(timings) * 0.95) - 1] * 1000:8.2f}ms {timings[-1] * 1000:8.2f}ms  {used_by}")
+            plans.append((name, explain(conn, build(user_ids[0], anonymous_ids[0]))))
+
+        print('\nQuery plans:')
+        for name, plan in plans:
+            print(f"  {name}:")
+            for line in plan:
+                print(f"    {line}")
+
+
+if __name__ == '__main__':
+    main()
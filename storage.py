@@ -0,0 +1,239 @@
+import logging
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+
+# Create a logger
+logger = logging.getLogger(__name__)
+
+# Keys this process remembers having stored successfully
+MAX_STORED_KEYS = 10000
+
+
+class Storage:
+    """Where uploads and generated images live, addressed by keys like 'generated/image_x.png'.
+
+    Files are always written locally first, so the instance that made them can
+    keep using them; put_async() then copies them to the backend off the
+    request thread.
+    """
+
+    backend = None
+    # True when files live somewhere other instances can reach
+    remote = False
+
+    def __init__(self, writers=4):
+        self.writers = writers
+        self._pending = {}
+        self._stored = OrderedDict()
+        self._lock = threading.Lock()
+        # Created on first use so every forked worker gets its own threads
+        self._executor = None
+
+    def put(self, key, path, content_type=None):
+        """Store the local file at path under key"""
+        raise NotImplementedError
+
+    def get(self, key):
+        """Return the bytes stored under key"""
+        with self.stream(key) as f:
+            return f.read()
+
+    def stream(self, key):
+        """Return a readable file object for key"""
+        raise NotImplementedError
+
+    def fetch(self, key, path):
+        """Copy key to the local path. Returns False if the key doesn't exist."""
+        raise NotImplementedError
+
+    def url(self, key, download_name=None):
+        """URL clients can fetch key from directly, or None if the app must serve it"""
+        return None
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def put_async(self, key, path, content_type=None):
+        """Queue put() on a background thread and return its future"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.writers, thread_name_prefix='storage-writer')
+            future = self._executor.submit(self._put_logged, key, path, content_type)
+            self._pending[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def is_pending(self, key):
+        """True while an asynchronous put of key hasn't finished"""
+        with self._lock:
+            return key in self._pending
+
+    def is_stored(self, key):
+        """True once an asynchronous put of key succeeded in this process.
+
+        False while it is pending, after it failed, and for keys this process
+        didn't write (or has forgotten), so callers fall back to local copies.
+        """
+        with self._lock:
+            return key in self._stored
+
+    def stats(self):
+        with self._lock:
+            return {'backend': self.backend, 'pending_writes': len(self._pending), 'writers': self.writers}
+
+    def _put_logged(self, key, path, content_type):
+        try:
+            self.put(key, path, content_type=content_type)
+            metrics.incr('storage.writes')
+            with self._lock:
+                self._stored[key] = True
+                self._stored.move_to_end(key)
+                while len(self._stored) > MAX_STORED_KEYS:
+                    self._stored.popitem(last=False)
+        except Exception as e:
+            with self._lock:
+                self._stored.pop(key, None)
+            metrics.incr('storage.write_errors')
+            logger.error(f"Error storing {key}: {str(e)}")
+            raise
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+
+class LocalStorage(Storage):
+    """Files in a directory on this instance, served by the app itself"""
+
+    backend = 'local'
+
+    def __init__(self, root='.', writers=4):
+        super().__init__(writers)
+        self.root = os.path.abspath(root)
+
+    def put(self, key, path, content_type=None):
+        target = self._path(key)
+        # Files are normally written in place already
+        if os.path.abspath(path) == target:
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target)
+
+    def put_async(self, key, path, content_type=None):
+        # Nothing to copy when the file was written in place
+        if os.path.abspath(path) == self._path(key):
+            return None
+        return super().put_async(key, path, content_type=content_type)
+
+    def stream(self, key):
+        return open(self._path(key), 'rb')
+
+    def fetch(self, key, path):
+        source = self._path(key)
+        if not os.path.exists(source):
+            return False
+        if os.path.abspath(path) != source:
+            shutil.copyfile(source, path)
+        return True
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+
+class S3Storage(Storage):
+    """Files in an S3-compatible bucket (S3, MinIO, GCS interoperability), served by presigned URL"""
+
+    backend = 's3'
+    remote = True
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, url_ttl=3600, writers=4):
+        super().__init__(writers)
+        # boto3 is only needed when this backend is used
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs boto3, install it with `pip install boto3`")
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.url_ttl = url_ttl
+        self._client_error = ClientError
+        # boto3 clients are thread-safe, so one serves every request and writer thread
+        self._client = boto3.client('s3', endpoint_url=endpoint_url or None, region_name=region or None)
+
+    def put(self, key, path, content_type=None):
+        content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self._client.upload_file(path, self.bucket, self._key(key), ExtraArgs={'ContentType': content_type})
+
+    def stream(self, key):
+        return self._client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+
+    def fetch(self, key, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        os.close(fd)
+        try:
+            self._client.download_file(self.bucket, self._key(key), temp_path)
+            os.replace(temp_path, path)
+            metrics.incr('storage.fetches')
+            return True
+        except self._client_error as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+                return False
+            raise
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def url(self, key, download_name=None):
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if download_name:
+            params['ResponseContentDisposition'] = f'attachment; filename="{download_name}"'
+        return self._client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.url_ttl)
+
+    def delete(self, key):
+        self._client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def stats(self):
+        return dict(super().stats(), bucket=self.bucket)
+
+    def _key(self, key):
+        key = key.replace(os.sep, '/')
+        if key.startswith('/') or '..' in key.split('/'):
+            raise ValueError(f"Invalid storage key: {key}")
+        return self.prefix + key
+
+
+def create_storage(app):
+    """Build the backend named by the STORAGE_BACKEND setting ('local' or 's3')"""
+    backend = app.config['STORAGE_BACKEND']
+    writers = app.config['STORAGE_WRITERS']
+    if backend == 's3':
+        return S3Storage(
+            bucket=app.config['STORAGE_BUCKET'],
+            prefix=app.config['STORAGE_PREFIX'],
+            endpoint_url=app.config['STORAGE_ENDPOINT_URL'],
+            region=app.config['STORAGE_REGION'],
+            url_ttl=app.config['STORAGE_URL_TTL_SECONDS'],
+            writers=writers
+        )
+    if backend != 'local':
+        logger.warning(f"Unknown STORAGE_BACKEND {backend}, using local disk")
+    return LocalStorage(writers=writers)
@@ -0,0 +1,98 @@
+import datetime
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from models import db, SuggestionCacheEntry
+from metrics import metrics
+
+# Create a logger
+logger = logging.getLogger(__name__)
+
+
+class SuggestionCache:
+    """Two-tier cache of Claude suggestions: an in-process LRU in front of a database table"""
+
+    def __init__(self, max_entries=512, ttl=7 * 86400, use_database=True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.use_database = use_database
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(original_hash, inspiration_hash, model, prompt_version):
+        """Combine everything that affects Claude's answer into one key"""
+        raw = f"{original_hash}:{inspiration_hash}:{model}:{prompt_version}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return cached suggestions for key, or None. Needs an app context for the database tier."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                metrics.incr('suggestion_cache.hits.memory')
+                return entry[1]
+            if entry:
+                del self._entries[key]
+
+        suggestions = self._get_from_database(key) if self.use_database else None
+        if suggestions is None:
+            metrics.incr('suggestion_cache.misses')
+            return None
+
+        metrics.incr('suggestion_cache.hits.database')
+        self._remember(key, suggestions, now + self.ttl)
+        return suggestions
+
+    def put(self, key, suggestions, model, prompt_version):
+        expires_at = time.time() + self.ttl
+        self._remember(key, suggestions, expires_at)
+        if self.use_database:
+            self._put_in_database(key, suggestions, model, prompt_version, expires_at)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries, 'ttl': self.ttl}
+
+    def _remember(self, key, suggestions, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, suggestions)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_from_database(self, key):
+        try:
+            entry = db.session.get(SuggestionCacheEntry, key)
+            if not entry:
+                return None
+            if entry.expires_at <= datetime.datetime.utcnow():
+                db.session.delete(entry)
+                db.session.commit()
+                return None
+            return json.loads(entry.suggestions)
+        except Exception as e:
+            logger.error(f"Error reading suggestion cache: {str(e)}")
+            db.session.rollback()
+            return None
+
+    def _put_in_database(self, key, suggestions, model, prompt_version, expires_at):
+        try:
+            db.session.merge(SuggestionCacheEntry(
+                key=key,
+                model=model,
+                prompt_version=prompt_version,
+                suggestions=json.dumps(suggestions),
+                created_at=datetime.datetime.utcnow(),
+                expires_at=datetime.datetime.utcfromtimestamp(expires_at)
+            ))
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"Error writing suggestion cache: {str(e)}")
+            db.session.rollback()
@@ -0,0 +1,164 @@
+import re
+import logging
+
+# Create a logger
+logger = logging.getLogger(__name__)
+
+# Prompt sent to Claude alongside the two images
+SUGGESTIONS_PROMPT = """You're the world's greatest interior designer. I'll show you two images:
+1. The first is a room I want to redesign
+2. The second is an inspiration image with a style I like
+
+Please suggest 3 different ways to redesign my room based on the inspiration image.
+For each suggestion, provide:
+- A clear, specific title (10 words or less)
+- A detailed description with color schemes, furniture placement, etc. (150-250 words)
+"""
+
+# Bump whenever SUGGESTIONS_PROMPT or the parsing changes so cached results are not reused
+PROMPT_VERSION = 1
+
+# Splits Claude's reply on "1." / "Suggestion 2:" style headings
+SUGGESTION_HEADING = re.compile(r'\n\s*(?:Suggestion |)\d+[\.:]\s*')
+
+# Leading text shorter than this is treated as an intro, not a suggestion
+MAX_INTRO_LENGTH = 100
+
+FALLBACK_DESCRIPTION = "I apologize, but I couldn't generate a detailed suggestion. Please try again or use one of the other redesign options."
+PARSE_ERROR_DESCRIPTION = "I apologize, but I couldn't parse the suggestions properly. This is a fallback suggestion. Please try again with your redesign."
+
+
+# Helper function to drop the intro Claude sometimes writes before the first heading
+def drop_intro(parts, more_to_come=False):
+    """parts without a leading intro, or None while that can't be told yet.
+
+    A short first part is an intro only when more than three parts follow it,
+    so a stream that might still grow can't decide until it has seen enough.
+    """
+    if parts and len(parts[0]) < MAX_INTRO_LENGTH:
+        if len(parts) > 3:
+            return parts[1:]
+        if more_to_come:
+            return None
+    return parts
+
+
+# Helper function to turn one section of Claude's reply into a suggestion
+def parse_suggestion_part(part):
+    lines = part.split('\n')
+    title = None
+    description = []
+
+    # First non-empty line is the title
+    for line in lines:
+        if line.strip() and not title:
+            title = line.strip()
+            # Remove any "Title:" prefix
+            title = re.sub(r'^Title:\s*', '', title)
+            # Remove any numbering
+            title = re.sub(r'^\d+[\.\)]\s*', '', title)
+        elif title:
+            # Everything after the title is the description
+            description.append(line)
+
+    # Join description lines
+    full_description = '\n'.join(description).strip()
+
+    # Clean up the description
+    full_description = re.sub(r'^Description:\s*', '', full_description)
+
+    # Only a suggestion if we have both title and description
+    if title and full_description:
+        return {
+            "title": title,
+            "description": full_description
+        }
+    return None
+
+
+# Helper function to parse suggestions from Claude
+def parse_suggestions(text):
+    suggestions = []
+
+    try:
+        # Split by suggestion numbers
+        parts = SUGGESTION_HEADING.split(text)
+
+        # Remove any empty parts and the first part if it's just an intro
+        parts = drop_intro([p.strip() for p in parts if p.strip()])
+
+        # Take up to 3 suggestions
+        parts = parts[:3]
+
+        for part in parts:
+            suggestion = parse_suggestion_part(part)
+            if suggestion:
+                suggestions.append(suggestion)
+
+        # If we don't have exactly 3 suggestions, create dummy ones
+        while len(suggestions) < 3:
+            suggestions.append({
+                "title": f"Redesign Option {len(suggestions) + 1}",
+                "description": FALLBACK_DESCRIPTION
+            })
+
+        return suggestions[:3]  # Ensure we return exactly 3 suggestions
+
+    except Exception as e:
+        logger.error(f"Error parsing suggestions: {str(e)}")
+        # Return default suggestions
+        return [
+            {"title": "Elegant Transformation", "description": PARSE_ERROR_DESCRIPTION},
+            {"title": "Modern Refresh", "description": PARSE_ERROR_DESCRIPTION},
+            {"title": "Cozy Makeover", "description": PARSE_ERROR_DESCRIPTION}
+        ]
+
+
+# Helper function to tell real suggestions from the placeholders we fill in
+def has_fallbacks(suggestions):
+    return any(s.get("description") in (FALLBACK_DESCRIPTION, PARSE_ERROR_DESCRIPTION) for s in suggestions)
+
+
+class SuggestionStreamParser:
+    """Parses suggestions out of Claude's reply as text streams in.
+
+    A suggestion is complete once the heading of the next one arrives, so
+    feed() can return suggestion 1 while 2 and 3 are still being written.
+    """
+
+    def __init__(self, limit=3):
+        self.limit = limit
+        self.text = ""
+        self.emitted = 0
+
+    def feed(self, chunk):
+        """Add streamed text and return any suggestions that are now complete"""
+        self.text += chunk
+        parts = [p.strip() for p in SUGGESTION_HEADING.split(self.text)]
+
+        # The last part may still be growing, but it counts towards telling an intro apart
+        growing = parts.pop()
+        parts = drop_intro([p for p in parts if p] + ([growing] if growing else []), more_to_come=True)
+        if parts is None:
+            return []
+        if growing:
+            parts = parts[:-1]
+
+        return self._take(parts)
+
+    def finish(self):
+        """Return the final list of suggestions and any not yet emitted"""
+        suggestions = parse_suggestions(self.text)
+        remaining = suggestions[self.emitted:]
+        self.emitted = len(suggestions)
+        return suggestions, remaining
+
+    def _take(self, parts):
+        new = []
+        for part in parts[self.emitted:self.limit]:
+            suggestion = parse_suggestion_part(part)
+            if not suggestion:
+                break
+            new.append(suggestion)
+            self.emitted += 1
+        return new
@@ -0,0 +1,32 @@
+import pytest
+
+from suggestions import SuggestionStreamParser, parse_suggestions
+
+DESCRIPTION = "Warm neutral walls, a low linen sofa facing the window and brass lamps either side of it."
+
+REPLIES = [
+    # Short intro, fewer than three headings: the intro is kept as a suggestion
+    "Sure thing\nHere you go.\n1. A\n" + DESCRIPTION + "\n2. C\n" + DESCRIPTION,
+    # Short intro before three headings: the intro is dropped
+    "Here are three ideas:\n\n1. A\n" + DESCRIPTION + "\n\n2. B\n" + DESCRIPTION + "\n\n3. C\n" + DESCRIPTION,
+    # No intro
+    "1. A\n" + DESCRIPTION + "\nSuggestion 2: B\n" + DESCRIPTION + "\nSuggestion 3: C\n" + DESCRIPTION,
+    # Long intro is always a suggestion
+    "Intro\n" + DESCRIPTION * 2 + "\n1. A\n" + DESCRIPTION + "\n2. B\n" + DESCRIPTION + "\n3. C\n" + DESCRIPTION,
+    # A part without a description
+    "Ideas:\n1. A\n2. B\n" + DESCRIPTION + "\n3. C\n" + DESCRIPTION + "\n4. D\n" + DESCRIPTION,
+]
+
+
+@pytest.mark.parametrize("text", REPLIES)
+@pytest.mark.parametrize("chunk_size", [1, 3, 17, 10000])
+def test_streamed_suggestions_match_parse_suggestions(text, chunk_size):
+    parser = SuggestionStreamParser()
+    streamed = []
+    for start in range(0, len(text), chunk_size):
+        streamed.extend(parser.feed(text[start:start + chunk_size]))
+
+    suggestions, remaining = parser.finish()
+
+    assert suggestions == parse_suggestions(text)
+    assert streamed + remaining == suggestions
@@ -0,0 +1,121 @@
+import datetime
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Redesign, UsageCounter
+from metrics import metrics
+
+# Create a logger
+logger = logging.getLogger(__name__)
+
+
+def usage_identity(user_id=None, anonymous_id=None):
+    """Counter key for a signed-in user or an anonymous visitor"""
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"anon:{anonymous_id}"
+
+
+class UsageCounters:
+    """Redesign counts per identity from the usage_counters table, behind an in-process TTL cache.
+
+    Counters are bumped in the same transaction as the Redesign row they count.
+    Identities without a counter row (no redesigns yet, or ones that predate
+    the table) fall back to counting their redesigns.
+    """
+
+    def __init__(self, ttl=30, max_entries=10000):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.configure(ttl, max_entries)
+
+    def configure(self, ttl=30, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def get(self, user_id=None, anonymous_id=None):
+        """Number of redesigns for the identity. Needs an app context."""
+        identity = usage_identity(user_id, anonymous_id)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(identity)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(identity)
+                metrics.incr('usage.cache_hits')
+                return entry[1]
+
+        metrics.incr('usage.cache_misses')
+        counter = db.session.get(UsageCounter, identity)
+        count = counter.count if counter else self._count_redesigns(user_id, anonymous_id)
+        self._remember(identity, count, now + self.ttl)
+        return count
+
+    def increment(self, user_id=None, anonymous_id=None):
+        """Add one to the identity's counter in the caller's transaction.
+
+        Call after adding the Redesign, and forget() the identity once committed.
+        """
+        identity = usage_identity(user_id, anonymous_id)
+        # The database adds one itself, so concurrent requests can't lose an update
+        updated = UsageCounter.query.filter_by(identity=identity).update(
+            {UsageCounter.count: UsageCounter.count + 1, UsageCounter.updated_at: datetime.datetime.utcnow()},
+            synchronize_session=False
+        )
+        if not updated:
+            # First counted redesign: start from the rows that already exist, including the new one
+            db.session.flush()
+            try:
+                with db.session.begin_nested():
+                    db.session.add(UsageCounter(
+                        identity=identity,
+                        count=self._count_redesigns(user_id, anonymous_id),
+                        updated_at=datetime.datetime.utcnow()
+                    ))
+            except IntegrityError:
+                # Another request created the row first
+                UsageCounter.query.filter_by(identity=identity).update(
+                    {UsageCounter.count: UsageCounter.count + 1}, synchronize_session=False
+                )
+
+    def transfer(self, anonymous_id, user_id, moved):
+        """Move the count for `moved` redesigns from an anonymous visitor to a user.
+
+        Runs in the caller's transaction; forget() both identities once committed.
+        """
+        UsageCounter.query.filter_by(identity=usage_identity(anonymous_id=anonymous_id)).delete(
+            synchronize_session=False
+        )
+        # A user without a counter row is counted from their redesigns, which now include these
+        UsageCounter.query.filter_by(identity=usage_identity(user_id=user_id)).update(
+            {UsageCounter.count: UsageCounter.count + moved, UsageCounter.updated_at: datetime.datetime.utcnow()},
+            synchronize_session=False
+        )
+
+    def forget(self, user_id=None, anonymous_id=None):
+        """Invalidate this process's cached count for the identity"""
+        with self._lock:
+            self._entries.pop(usage_identity(user_id, anonymous_id), None)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries, 'ttl': self.ttl}
+
+    def _count_redesigns(self, user_id, anonymous_id):
+        if user_id is not None:
+            return Redesign.query.filter_by(user_id=user_id).count()
+        return Redesign.query.filter_by(anonymous_id=anonymous_id).count()
+
+    def _remember(self, identity, count, expires_at):
+        with self._lock:
+            self._entries[identity] = (expires_at, count)
+            self._entries.move_to_end(identity)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# Shared counters for the whole process, configured from the app's config at startup
+usage_counters = UsageCounters()